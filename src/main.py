@@ -3,13 +3,15 @@ import sys
 # DON\"T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory, render_template
+from flask import Flask, send_from_directory, render_template, Response, jsonify
 from flask_cors import CORS
 from src.models.user import db
-from src.models.replay import Replay
+from src.models.replay import Replay, upgrade_schema
 from src.routes.user import user_bp
-from src.routes.replay import replay_bp
+from src.routes.replay import replay_bp, init_storage, initialize_buffer, start_background_services, get_health
 from src.utils.circular_buffer import CircularVideoBuffer
+from src.utils.metrics import REGISTRY, CONTENT_TYPE
+from src.utils.sqlite_tuning import configure_sqlite
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,11 +28,25 @@ app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(replay_bp, url_prefix='/api/replay')
 
 # uncomment if you need to use database
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'db.db')}"
+# SQLite em WAL com pool de conexões (cria src/database se não existir)
+configure_sqlite(app, os.path.join(os.path.dirname(__file__), 'database', 'db.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 with app.app_context():
     db.create_all()
+    upgrade_schema()
+    init_storage()
+
+@app.route('/metrics')
+def serve_metrics():
+    """métricas no formato texto do Prometheus"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/health')
+def serve_health():
+    """prontidão: 200 quando todas as câmeras já gravaram o primeiro segmento, 503 antes disso"""
+    health, ready = get_health()
+    return jsonify(health), 200 if ready else 503
 
 @app.route('/')
 def serve_root():
@@ -55,5 +71,9 @@ def serve_css():
 
 
 if __name__ == '__main__':
+    # começa a gravar antes do primeiro request; sob um servidor WSGI os
+    # buffers e as threads de segundo plano são iniciados no primeiro request de cada worker
+    start_background_services(app)
+    initialize_buffer()
     app.run(host='0.0.0.0', port=5000, debug=False)
 
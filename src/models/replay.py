@@ -1,21 +1,88 @@
 from src.models.user import db
 from datetime import datetime
+import json
+from sqlalchemy import inspect, text
+
+# campos que podem ser pedidos na listagem (?fields=)
+REPLAY_FIELDS = ('id', 'filename', 'timestamp', 'duration', 'file_size', 'status', 'job_id', 'camera', 'posters', 'pinned', 'renditions')
 
 class Replay(db.Model):
+    __table_args__ = (
+        # suporta a paginação por cursor (timestamp, id) em ordem decrescente
+        db.Index('ix_replay_timestamp_id', 'timestamp', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     duration = db.Column(db.Float, default=30.0)  # duração em segundos
     file_size = db.Column(db.Integer)  # tamanho do arquivo em bytes
     status = db.Column(db.String(50), default='saved')  # saved, processing, error
+    job_id = db.Column(db.String(32), index=True)  # job assíncrono que gerou o replay
+    camera = db.Column(db.String(64))  # câmera (ângulo) de onde veio o vídeo
+    posters = db.Column(db.Text)  # json: tamanho -> chave da imagem no cache de thumbnails
+    pinned = db.Column(db.Boolean, default=False)  # replays fixados não são removidos pela retenção
+    renditions = db.Column(db.Text)  # json: nome da rendition -> tamanho do arquivo em bytes
+    
+    def get_posters(self):
+        """retorna o dicionário tamanho -> chave dos posters gerados"""
+        return json.loads(self.posters) if self.posters else {}
+    
+    def set_posters(self, posters):
+        self.posters = json.dumps(posters) if posters else None
+    
+    def get_renditions(self):
+        """retorna o dicionário nome da rendition -> tamanho em bytes das renditions geradas"""
+        return json.loads(self.renditions) if self.renditions else {}
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'filename': self.filename,
-            'timestamp': self.timestamp.isoformat(),
-            'duration': self.duration,
-            'file_size': self.file_size,
-            'status': self.status
+    def set_renditions(self, renditions):
+        self.renditions = json.dumps(renditions) if renditions else None
+    
+    def stored_bytes(self):
+        """espaço ocupado pelo replay: o original mais as renditions"""
+        return (self.file_size or 0) + sum(self.get_renditions().values())
+    
+    def accounted_bytes(self):
+        """
+        bytes do replay contados no uso de disco: o original só entra quando é
+        salvo (arquivos parciais de replays com erro nunca foram somados)
+        """
+        renditions = sum(self.get_renditions().values())
+        return renditions + (self.file_size or 0 if self.status == 'saved' else 0)
+    
+    def to_dict(self, fields=None):
+        """
+        serializa o replay. fields limita os campos retornados (todos se None).
+        """
+        serializers = {
+            'id': lambda: self.id,
+            'filename': lambda: self.filename,
+            'timestamp': lambda: self.timestamp.isoformat(),
+            'duration': lambda: self.duration,
+            'file_size': lambda: self.file_size,
+            'status': lambda: self.status,
+            'job_id': lambda: self.job_id,
+            'camera': lambda: self.camera,
+            'posters': lambda: {size: f'/api/replay/thumbs/{key}.jpg' for size, key in self.get_posters().items()},
+            'pinned': lambda: bool(self.pinned),
+            'renditions': lambda: sorted(self.get_renditions())
         }
+        return {field: serializers[field]() for field in (fields or REPLAY_FIELDS)}
+
+def upgrade_schema():
+    """
+    adiciona colunas e índices novos em bancos criados por versões anteriores.
+    db.create_all() só cria tabelas que ainda não existem.
+    """
+    table = Replay.__table__
+    inspector = inspect(db.engine)
+    existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+
+    with db.engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(db.engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
 
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
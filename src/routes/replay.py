@@ -1,14 +1,32 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, current_app, Response, send_file, g
 from src.models.user import db
-from src.models.replay import Replay
-from src.utils.circular_buffer import CircularVideoBuffer
+from src.models.replay import Replay, REPLAY_FIELDS
+from sqlalchemy import or_, and_, func, event
+from sqlalchemy.orm import load_only, Session
+from src.utils.buffer_manager import BufferManager
+from src.utils.replay_jobs import ReplayJobQueue
+from src.utils.http_range import send_video
+from src.utils.thumbnail_cache import ThumbnailCache, POSTER_SIZES
+from src.utils.storage_accounting import StorageAccounting
+from src.utils.retention import RetentionPolicy, RetentionEngine
+from src.utils.event_bus import EventBus
+from src.utils.metrics import REGISTRY
+from src.utils.write_behind import WriteBehindQueue
+from src.utils.mp4_layout import Mp4LayoutUpgrader
+from src.utils.renditions import (RenditionTranscoder, DEFAULT_RENDITIONS, ORIGINAL_RENDITION, AUTO_RENDITION,
+                                  RENDITION_CLIENT_HINTS, rendition_filename, select_rendition)
 import os
+import json
+import math
+import base64
 import time
+import uuid
 import random
 import logging
 import colorlog
 import atexit
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta, timezone
 
 logger = logging.getLogger('replay')
 logger.setLevel(logging.INFO)
@@ -32,102 +50,526 @@ replay_bp = Blueprint('replay', __name__)
 # diretório para armazenar os replays
 REPLAYS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'replays')
 BUFFER_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'buffer')
+THUMBNAILS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'thumbnails')
 os.makedirs(REPLAYS_DIR, exist_ok=True)
 os.makedirs(BUFFER_DIR, exist_ok=True)
 
 logger.info(f"diretório de replays configurado em: {REPLAYS_DIR}")
 logger.info(f"diretório de buffer configurado em: {BUFFER_DIR}")
 
-# instância global do buffer circular
-circular_buffer = CircularVideoBuffer(
-    buffer_duration=60,
-    segment_duration=10,
-    video_source= 'USB CAMERA',  # nome da camera
-    output_dir=BUFFER_DIR
+# câmeras (ângulos) da quadra: nome -> configuração do buffer circular.
+# cada câmera grava em um subdiretório próprio do BUFFER_DIR
+CAMERAS = {
+    'principal': {
+        'buffer_duration': 60,
+        'segment_duration': 10,
+        'video_source': 'USB CAMERA',  # nome da camera
+        'storage': 'disk'  # 'memory' mantém os segmentos em RAM, sem escrita no cartão SD/SSD
+    },
+}
+
+# eventos enviados por SSE (replay salvo/removido, segmentos do buffer, erros de captura)
+event_bus = EventBus(history=256, max_subscribers=100, heartbeat=15)
+
+# formato dos replays salvos: 'mp4' (remux pelo FFmpeg) ou 'ts' (concatenação em processo, sem FFmpeg)
+REPLAY_FORMAT = 'mp4'
+# layout dos MP4: 'faststart' (moov no início) ou 'fragmented'; os dois tocam antes de baixar inteiro
+REPLAY_MP4_MODE = 'faststart'
+
+# instância global do gerenciador de buffers (um buffer circular por câmera)
+buffer_manager = BufferManager({
+    name: dict(config, output_dir=os.path.join(BUFFER_DIR, name), mp4_mode=REPLAY_MP4_MODE)
+    for name, config in CAMERAS.items()
+}, event_callback=event_bus.publish)
+
+# duração padrão de um replay em segundos (o trigger aceita ?seconds=N)
+REPLAY_SECONDS = 30
+
+VIDEO_MIMETYPES = {
+    '.mp4': 'video/mp4',
+    '.ts': 'video/mp2t'
+}
+
+# fila limitada de jobs de replay (o trigger só enfileira e responde 202)
+replay_jobs = ReplayJobQueue(max_workers=2, max_pending=8)
+# replays em 'processing' há mais tempo que isso são de um job perdido (reinício ou crash)
+REPLAY_JOB_TIMEOUT = 10 * 60
+
+# inserts e atualizações de status dos replays, agrupados em poucos commits
+db_writer = WriteBehindQueue(max_batch=100, max_delay=0.02)
+
+# uso de disco dos replays, atualizado a cada replay salvo/removido e conferido periodicamente
+storage_accounting = StorageAccounting(REPLAYS_DIR, reconcile_interval=600)
+
+# política de retenção: os replays mais antigos (não fixados) são removidos
+# quando algum limite é ultrapassado. None desativa o limite.
+RETENTION_POLICY = RetentionPolicy(
+    max_bytes=20 * 1024 * 1024 * 1024,  # 20 GB
+    max_age_days=30,
+    max_count=None
 )
+retention_engine = RetentionEngine(RETENTION_POLICY, REPLAYS_DIR, storage_accounting, db_writer,
+                                   interval=300, event_callback=event_bus.publish,
+                                   stale_processing_after=REPLAY_JOB_TIMEOUT)
+
+def _mp4_upgraded(filename, old_size, new_size):
+    """atualiza o tamanho de um replay regravado pelo Mp4LayoutUpgrader"""
+    storage_accounting.add(new_size - old_size)
+    db_writer.submit(lambda session: session.query(Replay).filter_by(filename=filename)
+                     .update({'file_size': new_size}, synchronize_session=False))
+
+# regrava em segundo plano os replays MP4 antigos, com o moov no fim do arquivo
+mp4_upgrader = Mp4LayoutUpgrader(REPLAYS_DIR, mode=REPLAY_MP4_MODE, on_upgraded=_mp4_upgraded)
+
+def _rendition_ready(replay_id, name, filename, file_size):
+    """registra uma rendition gerada; apaga o arquivo se o replay foi removido nesse meio tempo"""
+    def operation(session):
+        replay = session.get(Replay, replay_id)
+        if replay is None:
+            return False
+        renditions = replay.get_renditions()
+        renditions[name] = file_size
+        replay.set_renditions(renditions)
+        return True
+
+    if not db_writer.write(operation):
+        os.remove(os.path.join(REPLAYS_DIR, filename))
+        return
+    storage_accounting.add(file_size)
+    event_bus.publish('replay.rendition', {'id': replay_id, 'rendition': name})
+
+# versões menores dos replays (celulares no Wi-Fi do local), geradas em segundo
+# plano por um FFmpeg de cada vez e com prioridade baixa, para não tirar CPU da captura
+rendition_transcoder = RenditionTranscoder(REPLAYS_DIR, renditions=DEFAULT_RENDITIONS, max_workers=1,
+                                           max_pending=32, niceness=19, threads=2, on_complete=_rendition_ready)
+
+# cache de posters endereçado pelo conteúdo, com limite de tamanho
+thumbnail_cache = ThumbnailCache(THUMBNAILS_DIR, max_bytes=256 * 1024 * 1024)
+
+# posição relativa do frame usado como poster dentro do replay
+POSTER_POSITION = 0.5
+# cache dos posters no navegador (as URLs por chave nunca mudam de conteúdo)
+POSTER_MAX_AGE = 24 * 60 * 60
+THUMB_MAX_AGE = 365 * 24 * 60 * 60
+# segundos sugeridos (Retry-After) enquanto um poster fora do cache é gerado de novo
+POSTER_RETRY_AFTER = 2
+
+# tamanho dos blocos ao servir segmentos do buffer em memória
+LIVE_CHUNK_SIZE = 256 * 1024
+
+# tempo máximo de long-poll no status de um job
+MAX_JOB_WAIT = 30
+
+# tamanho padrão e máximo de uma página da listagem
+LIST_PAGE_SIZE = 50
+LIST_MAX_PAGE_SIZE = 200
+
+# métricas expostas em /metrics
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "rebote_http_request_seconds", "tempo das rotas de replay até a resposta", ["endpoint", "method", "status"])
+FILE_SEND_SECONDS = REGISTRY.histogram(
+    "rebote_file_send_seconds", "tempo até o fim do envio de arquivos de vídeo", ["endpoint"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+FILE_SENT_BYTES = REGISTRY.counter(
+    "rebote_file_sent_bytes_total", "bytes de vídeo enviados", ["endpoint"])
+DB_COMMIT_SECONDS = REGISTRY.histogram(
+    "rebote_db_commit_seconds", "duração dos commits no banco (flush incluso)",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+REGISTRY.gauge(
+    "rebote_buffer_available_seconds", "segundos de vídeo disponíveis no buffer", ["camera"],
+    callback=lambda: {(name,): buffer.get_available_duration() for name, buffer in buffer_manager.buffers.items()})
+REGISTRY.gauge(
+    "rebote_storage_used_bytes", "espaço ocupado pelos replays", callback=storage_accounting.get_usage)
+REGISTRY.gauge(
+    "rebote_replay_jobs_pending", "jobs de replay na fila ou em execução",
+    callback=lambda: replay_jobs.get_info()["pending"])
+REGISTRY.gauge(
+    "rebote_rendition_jobs_pending", "replays na fila de renditions ou em encode",
+    callback=lambda: rendition_transcoder.get_info()["pending"])
+REGISTRY.gauge(
+    "rebote_event_subscribers", "clientes conectados ao canal de eventos",
+    callback=lambda: event_bus.get_info()["subscribers"])
+
+@event.listens_for(Session, 'before_commit')
+def _commit_started(session):
+    session.info['commit_started'] = time.perf_counter()
+
+@event.listens_for(Session, 'after_commit')
+def _commit_finished(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+@replay_bp.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@replay_bp.after_request
+def _observe_request(response):
+    started = g.get('request_started')
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=request.endpoint or 'desconhecido',
+                                     method=request.method, status=response.status_code)
+    return response
+
+def _file_send_observer():
+    """
+    callback para quando o corpo de um vídeo termina de ser enviado (depois do
+    after_request): registra o tempo total e os bytes enviados pela rota atual.
+    """
+    endpoint = request.endpoint
+    started = g.get('request_started', time.perf_counter())
+    
+    def observe(sent_bytes):
+        FILE_SEND_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        FILE_SENT_BYTES.inc(sent_bytes, endpoint=endpoint)
+    
+    return observe
 
 @atexit.register
 def cleanup_on_exit():
-    logger.info("encerrando a aplicação, parando o buffer circular...")
-    if circular_buffer.is_recording:
-        circular_buffer.stop_recording()
+    logger.info("encerrando a aplicação, parando os buffers circulares...")
+    event_bus.close()
+    replay_jobs.shutdown(wait=True)
+    rendition_transcoder.shutdown(wait=True)
+    mp4_upgrader.stop()
+    db_writer.stop()
+    buffer_manager.shutdown()
+    retention_engine.stop()
+    storage_accounting.stop()
+
+# pid do processo que iniciou os buffers: depois de um fork (ex.: workers do
+# gunicorn com --preload) as threads de gravação não existem no processo filho
+_buffers_started_pid = None
+_buffers_start_lock = threading.Lock()
 
 def initialize_buffer():
     """
-    inicializa o buffer circular quando o módulo é carregado.
+    inicia os buffers circulares uma vez por processo, sem esperar o primeiro
+    segmento. chamada no primeiro request (ou ao rodar o servidor), e não na
+    importação do módulo, para não atrasar a criação da aplicação nem gravar
+    no processo mestre antes do fork.
     """
-    try:
-        logger.info("inicializando buffer circular...")
-        circular_buffer.start_recording()
-        logger.info("buffer circular inicializado com sucesso")
-    except Exception as e:
-        logger.error(f"erro ao inicializar buffer circular: {e}")
+    global _buffers_started_pid
+    if _buffers_started_pid == os.getpid():
+        return
+    with _buffers_start_lock:
+        if _buffers_started_pid == os.getpid():
+            return
+        try:
+            logger.info("inicializando buffers circulares...")
+            buffer_manager.start_all()
+            logger.info("buffers circulares inicializados, aguardando o primeiro segmento")
+        except Exception as e:
+            logger.error(f"erro ao inicializar buffer circular: {e}")
+        _buffers_started_pid = os.getpid()
+
+# pid do processo que iniciou as threads de segundo plano (fila de escrita,
+# reconciliador, retenção, regravação de MP4): como os buffers, elas não
+# existem em um processo filho depois do fork
+_services_started_pid = None
+_services_start_lock = threading.Lock()
+
+def start_background_services(app):
+    """
+    inicia as threads de segundo plano uma vez por processo. chamada no
+    primeiro request de cada worker (ou ao rodar o servidor).
+    """
+    global _services_started_pid
+    if _services_started_pid == os.getpid():
+        return
+    with _services_start_lock:
+        if _services_started_pid == os.getpid():
+            return
+        with app.app_context():
+            # conexões herdadas do processo pai não podem ser usadas no filho
+            db.engine.dispose(close=False)
+        db_writer.start(app)
+        db_writer.submit(_fail_stale_replays)
+        storage_accounting.start()
+        retention_engine.start(app)
+        mp4_upgrader.start()
+        _services_started_pid = os.getpid()
+
+# avisado uma vez por processo quando o servidor roda com vários workers
+_multiprocess_logged = False
+
+@replay_bp.before_app_request
+def _ensure_buffers_started():
+    global _multiprocess_logged
+    # câmeras, eventos (SSE e histórico do Last-Event-ID), fila de jobs e uso de
+    # disco vivem na memória do processo: um segundo worker capturaria as mesmas
+    # câmeras e veria outro estado. o servidor precisa de um worker (com threads)
+    if request.environ.get('wsgi.multiprocess'):
+        if not _multiprocess_logged:
+            logger.critical("o rebote precisa rodar com um único worker (ex.: gunicorn -w 1 --threads 8)")
+            _multiprocess_logged = True
+        return jsonify({
+            'success': False,
+            'message': 'servidor configurado com vários workers; use um único worker'
+        }), 500
+    start_background_services(current_app._get_current_object())
+    initialize_buffer()
+
+def get_health():
+    """
+    estado de prontidão do serviço: pronto quando todas as câmeras já têm
+    pelo menos um segmento no buffer. retorna (dados, pronto).
+    """
+    cameras = {
+        name: {
+            'recording': buffer.is_recording,
+            'ready': buffer.ready.is_set(),
+            'available_seconds': buffer.get_available_duration()
+        }
+        for name, buffer in buffer_manager.buffers.items()
+    }
+    ready = buffer_manager.is_ready
+    return {'status': 'ok' if ready else 'starting', 'ready': ready, 'cameras': cameras}, ready
+
+def init_storage():
+    """
+    carrega o uso de disco a partir da soma de Replay.file_size. deve ser
+    chamada dentro do contexto da aplicação, depois de criar as tabelas; as
+    threads que usam o banco são iniciadas por start_background_services.
+    """
+    used_bytes = db.session.query(func.coalesce(func.sum(Replay.file_size), 0)) \
+        .filter(Replay.status == 'saved').scalar()
+    for (renditions,) in db.session.query(Replay.renditions).filter(Replay.renditions.isnot(None)):
+        used_bytes += sum(json.loads(renditions).values())
+    storage_accounting.set_usage(used_bytes)
+    logger.info(f"uso de armazenamento inicial: {used_bytes} bytes")
+
+def process_replay_job(app, replays, seconds, until):
+    """
+    job executado no pool: salva os `seconds` segundos de todas as câmeras até
+    o momento do trigger, em paralelo, e atualiza o status de cada replay no banco.
+    
+    Args:
+        replays: dicionário nome da câmera -> (id do replay, caminho do arquivo)
+        until: horário unix do trigger (o job pode começar bem depois, com a fila cheia)
+    """
+    with app.app_context():
+        try:
+            results = buffer_manager.save_all(
+                {camera: file_path for camera, (_, file_path) in replays.items()},
+                seconds=seconds,
+                until=until
+            )
+        except Exception as e:
+            logger.error(f"erro ao salvar replays do buffer: {str(e)}", exc_info=True)
+            results = {}
+
+        # resultado de cada replay, verificado fora da transação: (tamanho, duração
+        # real da janela cortada nos keyframes) ou None se falhou
+        outcomes = {}
+        for camera, (replay_id, file_path) in replays.items():
+            window = results.get(camera)
+            if window is None:
+                logger.error(f"falha ao salvar replay da câmera {camera}")
+            elif not os.path.exists(file_path):
+                logger.error(f"arquivo de replay não foi criado: {file_path}")
+                window = None
+            outcomes[replay_id] = (os.path.getsize(file_path), window[1] - window[0]) if window else None
+
+        def update_replays(session):
+            statuses = {}
+            for replay_id, outcome in outcomes.items():
+                replay = session.get(Replay, replay_id)
+                if replay is None:
+                    logger.error(f"replay ID {replay_id} não encontrado para o job")
+                    continue
+                if outcome is not None:
+                    replay.file_size, replay.duration = outcome
+                    replay.status = 'saved'
+                else:
+                    replay.status = 'error'
+                statuses[replay_id] = replay.status
+            return statuses
+
+        replay_ids = list(outcomes)
+        try:
+            statuses = db_writer.write(update_replays)
+            logger.info(f"replays {replay_ids} atualizados no banco de dados")
+        except Exception as e:
+            logger.error(f"erro ao atualizar replays no banco: {str(e)}", exc_info=True)
+            try:
+                db_writer.write(_set_status(replay_ids, 'error'))
+            except Exception as e:
+                logger.error(f"erro ao marcar replays com erro: {str(e)}")
+            for replay_id in replay_ids:
+                event_bus.publish('replay.error', {'id': replay_id})
+            return False
+
+        for replay_id, status in statuses.items():
+            if status == 'saved':
+                file_size, duration = outcomes[replay_id]
+                storage_accounting.add(file_size)
+                logger.info(f"replay {replay_id} salvo com sucesso ({file_size} bytes, {duration:.1f}s)")
+        all_saved = len(statuses) == len(outcomes) and all(status == 'saved' for status in statuses.values())
+
+        # posters gerados logo após salvar, para a listagem nunca gerar imagens
+        posters = {}
+        for replay_id, file_path in replays.values():
+            if statuses.get(replay_id) == 'saved':
+                try:
+                    posters[replay_id] = generate_posters(file_path, outcomes[replay_id][1])
+                except Exception as e:
+                    logger.error(f"erro ao gerar posters: {str(e)}", exc_info=True)
 
-# inicializa o buffer quando o módulo é importado
-initialize_buffer()
+        def store_posters(session):
+            payloads = []
+            for replay_id in replay_ids:
+                replay = session.get(Replay, replay_id)
+                if replay is None:
+                    continue
+                if replay_id in posters:
+                    replay.set_posters(posters[replay_id])
+                payloads.append(replay.to_dict())
+            return payloads
+
+        # avisa os clientes conectados, já com os posters
+        try:
+            for payload in db_writer.write(store_posters):
+                event_bus.publish(f"replay.{payload['status']}", payload)
+        except Exception as e:
+            logger.error(f"erro ao gravar posters: {str(e)}", exc_info=True)
+
+        # renditions menores em segundo plano, depois que o original já está disponível
+        for replay_id, file_path in replays.values():
+            if statuses.get(replay_id) == 'saved':
+                rendition_transcoder.submit(replay_id, os.path.basename(file_path))
+
+        # novos arquivos podem ter passado dos limites de armazenamento
+        retention_engine.wake()
+        return all_saved
+
+def _fail_stale_replays(session):
+    """
+    operação da fila de escrita que marca com erro os replays presos em
+    'processing': os jobs só existem em memória e não sobrevivem a um reinício
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=REPLAY_JOB_TIMEOUT)
+    stale = session.query(Replay).filter(Replay.status == 'processing', Replay.timestamp < cutoff) \
+        .update({'status': 'error'}, synchronize_session=False)
+    if stale:
+        logger.warning(f"{stale} replays de jobs interrompidos marcados com erro")
+    return stale
+
+def _set_status(replay_ids, status):
+    """operação da fila de escrita que muda o status de vários replays"""
+    def operation(session):
+        session.query(Replay).filter(Replay.id.in_(replay_ids)) \
+            .update({'status': status}, synchronize_session=False)
+    return operation
+
+def _store_posters(replay_id, posters):
+    """operação da fila de escrita que grava as chaves dos posters de um replay"""
+    def operation(session):
+        replay = session.get(Replay, replay_id)
+        if replay is not None:
+            replay.set_posters(posters)
+    return operation
+
+def regenerate_posters(replay_id, file_path, duration):
+    """job que extrai de novo os posters de um replay fora do cache e grava as chaves"""
+    posters = generate_posters(file_path, duration)
+    if not posters:
+        return False
+    db_writer.write(_store_posters(replay_id, posters))
+    return True
+
+def generate_posters(file_path, duration):
+    """extrai os posters de um replay em todos os tamanhos e guarda no cache"""
+    posters = thumbnail_cache.generate(file_path, position=POSTER_POSITION, duration=duration)
+    if posters:
+        logger.info(f"posters gerados para {file_path}")
+    return posters
 
 @replay_bp.route('/trigger', methods=['POST'])
 def trigger_replay():
     """
     endpoint para receber o trigger do botão e salvar um replay.
-    usa o buffer circular para salvar os últimos 30 segundos.
+    enfileira um job que salva os últimos 30 segundos (ou ?seconds=N) de todas
+    as câmeras no mesmo momento e responde 202 imediatamente com o id do job.
     """
     try:
+        # a janela termina no momento do botão, não quando o job sair da fila
+        triggered_at = time.time()
         logger.info(f"iniciando captura de replay - IP: {request.remote_addr}")
         
         # verifica se o buffer está gravando
-        if not circular_buffer.is_recording:
+        if not buffer_manager.is_recording:
             logger.error("buffer circular não está gravando")
             return jsonify({
                 'success': False,
                 'message': 'buffer circular não está ativo'
             }), 500
         
-        # gera um nome de arquivo único
-        timestamp = datetime.now().strftime('%d-%m-%Y_%H-%M-%S')
-        filename = f'replay-{timestamp}.mp4'
-        file_path = os.path.join(REPLAYS_DIR, filename)
+        seconds = request.args.get('seconds', REPLAY_SECONDS, type=float)
+        # nan e inf passam pelo float() e não viram JSON válido
+        if not math.isfinite(seconds) or seconds <= 0:
+            return jsonify({
+                'success': False,
+                'message': 'duração do replay inválida'
+            }), 400
+        max_seconds = min(buffer.buffer_duration for buffer in buffer_manager.buffers.values())
+        if seconds > max_seconds:
+            return jsonify({
+                'success': False,
+                'message': f'duração do replay maior que o buffer ({max_seconds}s)'
+            }), 400
         
-        logger.info(f"nome do arquivo gerado: {filename}")
+        # gera um nome de arquivo único por câmera (vários triggers podem cair no mesmo segundo)
+        job_id = uuid.uuid4().hex
+        timestamp = datetime.now().strftime('%d-%m-%Y_%H-%M-%S')
         
-        # salva o replay usando o buffer circular
-        success = circular_buffer.save_replay(file_path)
+        # registra um replay por câmera como em processamento; o insert entra
+        # no próximo commit da fila de escrita junto com os de outros triggers
+        def insert_replays(session):
+            replays = []
+            for camera in buffer_manager.cameras:
+                filename = f'replay-{timestamp}-{job_id[:8]}-{camera}.{REPLAY_FORMAT}'
+                logger.info(f"nome do arquivo gerado: {filename}")
+                replays.append(Replay(
+                    filename=filename,
+                    duration=seconds,
+                    status='processing',
+                    job_id=job_id,
+                    camera=camera
+                ))
+            session.add_all(replays)
+            session.flush()
+            return [replay.to_dict() for replay in replays]
         
-        if not success:
-            logger.error("falha ao salvar replay do buffer circular")
-            return jsonify({
-                'success': False,
-                'message': 'erro ao salvar replay do buffer'
-            }), 500
+        replays = db_writer.write(insert_replays)
         
-        # verifica se o arquivo foi criado e obtém seu tamanho
-        if not os.path.exists(file_path):
-            logger.error(f"frquivo de replay não foi criado: {file_path}")
+        job_replays = {
+            replay['camera']: (replay['id'], os.path.join(REPLAYS_DIR, replay['filename']))
+            for replay in replays
+        }
+        replay_ids = [replay['id'] for replay in replays]
+        app = current_app._get_current_object()
+        if not replay_jobs.submit(job_id, process_replay_job, app, job_replays, seconds, triggered_at):
+            db_writer.submit(_set_status(replay_ids, 'error'))
             return jsonify({
                 'success': False,
-                'message': 'arquivo de replay não foi criado'
-            }), 500
-        
-        file_size = os.path.getsize(file_path)
-        logger.info(f"replay salvo com sucesso: {file_path} ({file_size} bytes)")
+                'message': 'muitos replays em processamento, tente novamente'
+            }), 429
         
-        # salva no banco de dados
-        replay = Replay(
-            filename=filename,
-            file_size=file_size,
-            status='saved'
-        )
-        db.session.add(replay)
-        db.session.commit()
-        logger.info(f"Replay ID {replay.id} salvo no banco de dados")
+        logger.info(f"replays {replay_ids} enfileirados no job {job_id}")
         
+        replay = replays[0]
         return jsonify({
             'success': True,
-            'message': 'replay salvo com sucesso',
-            'replay': replay.to_dict(),
-            'video_url': f'/api/replay/video/{replay.id}',
-            'poster_url': f'/api/replay/poster/{replay.id}'
-        }), 200
+            'message': 'replay em processamento',
+            'job_id': job_id,
+            'status_url': f'/api/replay/jobs/{job_id}',
+            'replay': replay,
+            'replays': replays,
+            'video_url': f"/api/replay/video/{replay['id']}",
+            'poster_url': f"/api/replay/poster/{replay['id']}"
+        }), 202
         
     except Exception as e:
         logger.error(f"erro ao processar replay: {str(e)}", exc_info=True)
@@ -136,19 +578,140 @@ def trigger_replay():
             'message': f'erro ao processar replay: {str(e)}'
         }), 500
 
+@replay_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """
+    retorna o status de um job de replay.
+    com ?wait=N aguarda até N segundos (long-poll) o job terminar.
+    """
+    try:
+        wait = min(max(request.args.get('wait', 0, type=float), 0), MAX_JOB_WAIT)
+        deadline = time.monotonic() + wait
+
+        if wait and replay_jobs.wait(job_id, wait) is None:
+            # job de outro processo: consulta o banco até terminar ou o tempo esgotar
+            while time.monotonic() < deadline:
+                statuses = [status for (status,) in db.session.query(Replay.status).filter_by(job_id=job_id)]
+                if statuses and 'processing' not in statuses:
+                    break
+                db.session.rollback()  # encerra a transação para enxergar novos commits
+                time.sleep(0.5)
+
+        replays = Replay.query.filter_by(job_id=job_id).all()
+        if not replays:
+            return jsonify({
+                'success': False,
+                'message': 'job não encontrado'
+            }), 404
+
+        statuses = {replay.status for replay in replays}
+        if 'processing' in statuses:
+            status = 'processing'
+        elif 'error' in statuses:
+            status = 'error'
+        else:
+            status = 'saved'
+
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': status,
+            'replays': [replay.to_dict() for replay in replays]
+        }), 200
+
+    except Exception as e:
+        logger.error(f"erro ao obter status do job {job_id}: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'erro ao obter status do job: {str(e)}'
+        }), 500
+
+def _encode_cursor(replay):
+    """cursor opaco com a posição (timestamp, id) do último replay da página"""
+    raw = f"{replay.timestamp.isoformat()}|{replay.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    """retorna (timestamp, id) do cursor; ValueError se for inválido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, replay_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(replay_id)
+    except Exception:
+        raise ValueError(f'cursor inválido: {cursor}')
+
+def _parse_date(value):
+    """data ISO 8601 em UTC sem fuso, como os timestamps do banco"""
+    date = datetime.fromisoformat(value)
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
 @replay_bp.route('/list', methods=['GET'])
 def list_replays():
     """
-    lista todos os replays salvos.
+    lista os replays salvos, do mais recente para o mais antigo, paginados por cursor.
+    
+    parâmetros:
+        limit: replays por página (padrão 50, máximo 200)
+        cursor: next_cursor da página anterior
+        fields: campos retornados, separados por vírgula (ex.: id,timestamp,posters)
+        from, to: intervalo de datas (ISO 8601) do timestamp do replay
+    
+    a resposta tem ETag; com If-None-Match igual a página retorna 304.
     """
     try:
         logger.info("solicitação de listagem de replays")
-        replays = Replay.query.order_by(Replay.timestamp.desc()).all()
+        
+        try:
+            limit = min(max(int(request.args.get('limit', LIST_PAGE_SIZE)), 1), LIST_MAX_PAGE_SIZE)
+            
+            fields = None
+            if request.args.get('fields'):
+                fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+                invalid = [field for field in fields if field not in REPLAY_FIELDS]
+                if invalid:
+                    raise ValueError(f"campos inválidos: {', '.join(invalid)}")
+            
+            date_from = _parse_date(request.args['from']) if request.args.get('from') else None
+            date_to = _parse_date(request.args['to']) if request.args.get('to') else None
+            cursor = _decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        query = Replay.query
+        if fields:
+            # carrega só as colunas pedidas (mais as da ordenação, usadas no cursor)
+            columns = {Replay.id, Replay.timestamp} | {getattr(Replay, field) for field in fields}
+            query = query.options(load_only(*columns))
+        if date_from is not None:
+            query = query.filter(Replay.timestamp >= date_from)
+        if date_to is not None:
+            query = query.filter(Replay.timestamp <= date_to)
+        if cursor is not None:
+            cursor_timestamp, cursor_id = cursor
+            query = query.filter(or_(
+                Replay.timestamp < cursor_timestamp,
+                and_(Replay.timestamp == cursor_timestamp, Replay.id < cursor_id)
+            ))
+        
+        # um a mais para saber se existe próxima página
+        replays = query.order_by(Replay.timestamp.desc(), Replay.id.desc()).limit(limit + 1).all()
+        has_more = len(replays) > limit
+        replays = replays[:limit]
+        
         logger.info(f"retornando {len(replays)} replays")
-        return jsonify({
+        response = jsonify({
             'success': True,
-            'replays': [replay.to_dict() for replay in replays]
-        }), 200
+            'replays': [replay.to_dict(fields) for replay in replays],
+            'next_cursor': _encode_cursor(replays[-1]) if has_more else None
+        })
+        response.add_etag()
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"erro ao listar replays: {str(e)}", exc_info=True)
         return jsonify({
@@ -156,19 +719,54 @@ def list_replays():
             'message': f'erro ao listar replays: {str(e)}'
         }), 500
 
+RENDITION_NAMES = [rendition['name'] for rendition in DEFAULT_RENDITIONS]
+
+def _video_filename(replay, use_hints):
+    """
+    arquivo a enviar para um replay: o original ou a rendition escolhida por
+    ?rendition= (original, auto ou um nome) ou, se use_hints, pelos client hints.
+    levanta ValueError para um ?rendition= desconhecido.
+    """
+    requested = request.args.get('rendition')
+    if requested is not None and requested not in (ORIGINAL_RENDITION, AUTO_RENDITION, *RENDITION_NAMES):
+        raise ValueError(f'rendition inválida: {requested}')
+    
+    original_bitrate = None
+    if replay.file_size and replay.duration:
+        original_bitrate = replay.file_size * 8 / replay.duration / 1000
+    name = select_rendition(replay.get_renditions(), requested, request.headers if use_hints else None,
+                            original_bitrate=original_bitrate)
+    if name is None:
+        return replay.filename
+    return rendition_filename(replay.filename, name)
+
 @replay_bp.route('/video/<int:replay_id>', methods=['GET'])
 def get_video(replay_id):
     """
-    retorna o arquivo de vídeo do replay.
+    retorna o arquivo de vídeo do replay, com suporte a Range e requisições condicionais.
+    ?rendition=original|auto|360p|480p|720p escolhe a versão; sem o parâmetro a
+    escolha usa os client hints (Save-Data, Downlink, ECT, Viewport-Width).
     """
     try:
         logger.info(f"solicitação de vídeo para replay ID: {replay_id}")
         replay = Replay.query.get_or_404(replay_id)
-        file_path = os.path.join(REPLAYS_DIR, replay.filename)
+        try:
+            filename = _video_filename(replay, use_hints=True)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        file_path = os.path.join(REPLAYS_DIR, filename)
         
         if os.path.exists(file_path):
             logger.info(f"enviando arquivo de replay: {file_path}")
-            return send_file(file_path, as_attachment=False, mimetype='video/mp4')
+            mimetype = VIDEO_MIMETYPES.get(os.path.splitext(filename)[1], 'video/mp4')
+            response = send_video(file_path, mimetype=mimetype, on_close=_file_send_observer())
+            # a resposta depende dos hints: pede que o navegador os envie e separa o cache por eles
+            response.headers['Accept-CH'] = ', '.join(RENDITION_CLIENT_HINTS)
+            response.vary.update(RENDITION_CLIENT_HINTS)
+            return response
         else:
             logger.warning(f"arquivo de replay não encontrado: {file_path}")
             return jsonify({
@@ -191,11 +789,21 @@ def download_video(replay_id):
     try:
         logger.info(f"solicitação de download para replay ID: {replay_id}")
         replay = Replay.query.get_or_404(replay_id)
-        file_path = os.path.join(REPLAYS_DIR, replay.filename)
+        try:
+            # o download só troca o original quando pedido explicitamente
+            filename = _video_filename(replay, use_hints=False)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        file_path = os.path.join(REPLAYS_DIR, filename)
         
         if os.path.exists(file_path):
             logger.info(f"enviando arquivo para download: {file_path}")
-            return send_file(file_path, as_attachment=True, download_name=replay.filename)
+            mimetype = VIDEO_MIMETYPES.get(os.path.splitext(filename)[1], 'application/octet-stream')
+            return send_video(file_path, mimetype=mimetype, as_attachment=True, download_name=filename,
+                              on_close=_file_send_observer())
         else:
             logger.warning(f"arquivo de replay não encontrado: {file_path}")
             return jsonify({
@@ -213,18 +821,45 @@ def download_video(replay_id):
 @replay_bp.route('/poster/<int:replay_id>', methods=['GET'])
 def get_poster(replay_id):
     """
-    retorna uma imagem poster para o vídeo.
+    retorna a imagem poster do replay (?size=small|medium|large, padrão medium).
+    os posters são gerados logo após o replay ser salvo; aqui só são servidos.
+    um poster fora do cache é gerado de novo na fila de jobs e, enquanto isso,
+    a resposta é 404 com Retry-After.
     """
     try:
         logger.info(f"solicitação de poster para replay ID: {replay_id}")
         replay = Replay.query.get_or_404(replay_id)
         
-        # por enquanto, retorna um placeholder
-        logger.info(f"retornando poster placeholder para replay ID: {replay_id}")
-        return jsonify({
-            'success': True,
-            'poster_url': f'https://placehold.co/1280x720/333/fff?text=replay+{replay.id}'
-        }), 200
+        size = request.args.get('size', 'medium')
+        if size not in POSTER_SIZES:
+            return jsonify({
+                'success': False,
+                'message': f'tamanho de poster inválido: {size}'
+            }), 400
+        
+        key = replay.get_posters().get(size)
+        image_path = thumbnail_cache.get_path(key)
+        if image_path is None:
+            # poster removido do cache ou replay antigo: gera de novo a partir do vídeo
+            file_path = os.path.join(REPLAYS_DIR, replay.filename)
+            if replay.status != 'saved' or not os.path.exists(file_path):
+                return jsonify({
+                    'success': False,
+                    'message': 'poster não disponível'
+                }), 404
+            # a extração roda na fila de jobs; o request não espera o FFmpeg
+            job_id = f"poster-{replay_id}"
+            if replay_jobs.get_status(job_id) != 'processing':
+                logger.info(f"poster do replay ID {replay_id} fora do cache, gerando novamente")
+                replay_jobs.submit(job_id, regenerate_posters, replay_id, file_path, replay.duration)
+            response = jsonify({
+                'success': False,
+                'message': 'poster sendo gerado'
+            })
+            response.headers['Retry-After'] = str(POSTER_RETRY_AFTER)
+            return response, 404
+        
+        return send_file(image_path, mimetype='image/jpeg', etag=key, max_age=POSTER_MAX_AGE, conditional=True)
         
     except Exception as e:
         logger.error(f"erro ao buscar poster para replay ID {replay_id}: {str(e)}", exc_info=True)
@@ -233,6 +868,23 @@ def get_poster(replay_id):
             'message': f'erro ao buscar poster: {str(e)}'
         }), 500
 
+@replay_bp.route('/thumbs/<key>.jpg', methods=['GET'])
+def get_thumbnail(key):
+    """
+    serve uma imagem do cache de thumbnails pela chave (sha256 do conteúdo).
+    o conteúdo de uma chave nunca muda, então o navegador pode guardar para sempre.
+    """
+    image_path = thumbnail_cache.get_path(key)
+    if image_path is None:
+        return jsonify({
+            'success': False,
+            'message': 'thumbnail não encontrado'
+        }), 404
+    
+    response = send_file(image_path, mimetype='image/jpeg', etag=key, max_age=THUMB_MAX_AGE, conditional=True)
+    response.cache_control.immutable = True
+    return response
+
 @replay_bp.route('/delete/<int:replay_id>', methods=['DELETE'])
 def delete_replay(replay_id):
     """
@@ -241,19 +893,34 @@ def delete_replay(replay_id):
     try:
         logger.info(f"solicitação para deletar replay ID: {replay_id}")
         replay = Replay.query.get_or_404(replay_id)
+        filenames = [replay.filename, *(rendition_filename(replay.filename, name) for name in replay.get_renditions())]
+        accounted_bytes = replay.accounted_bytes()
+        db.session.rollback()
         
-        # remove o arquivo físico
-        file_path = os.path.join(REPLAYS_DIR, replay.filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            logger.info(f"arquivo físico removido: {file_path}")
-        else:
-            logger.warning(f"arquivo não encontrado para exclusão: {file_path}")
+        # o registro sai primeiro, pela fila de escrita; os arquivos só depois do commit
+        deleted = db_writer.write(lambda session: session.query(Replay).filter_by(id=replay_id)
+                                  .delete(synchronize_session=False))
+        if not deleted:
+            # removido por outro request ou pela retenção nesse meio tempo
+            return jsonify({
+                'success': False,
+                'message': 'replay não encontrado'
+            }), 404
+        
+        for filename in filenames:
+            file_path = os.path.join(REPLAYS_DIR, filename)
+            try:
+                os.remove(file_path)
+                logger.info(f"arquivo físico removido: {file_path}")
+            except FileNotFoundError:
+                logger.warning(f"arquivo não encontrado para exclusão: {file_path}")
+            except OSError as e:
+                # o registro já saiu: o arquivo entra na próxima reconciliação do uso de disco
+                logger.error(f"não foi possível remover {file_path}: {e}")
+        storage_accounting.remove(accounted_bytes)
         
-        # remove do banco de dados
-        db.session.delete(replay)
-        db.session.commit()
         logger.info(f"- replay ID {replay_id} removido do banco de dados")
+        event_bus.publish('replay.deleted', {'id': replay_id, 'reason': 'manual'})
         
         return jsonify({
             'success': True,
@@ -267,14 +934,59 @@ def delete_replay(replay_id):
             'message': f'erro ao deletar replay: {str(e)}'
         }), 500
 
+@replay_bp.route('/pin/<int:replay_id>', methods=['POST', 'DELETE'])
+def pin_replay(replay_id):
+    """
+    fixa (POST) ou desafixa (DELETE) um replay. replays fixados não são
+    removidos pela política de retenção.
+    """
+    try:
+        pinned = request.method == 'POST'
+        
+        def operation(session):
+            replay = session.get(Replay, replay_id)
+            if replay is None:
+                return None
+            replay.pinned = pinned
+            return replay.to_dict()
+        
+        payload = db_writer.write(operation)
+        if payload is None:
+            return jsonify({
+                'success': False,
+                'message': 'replay não encontrado'
+            }), 404
+        logger.info(f"replay ID {replay_id} {'fixado' if pinned else 'desafixado'}")
+        
+        return jsonify({
+            'success': True,
+            'replay': payload
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"erro ao fixar replay ID {replay_id}: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'erro ao fixar replay: {str(e)}'
+        }), 500
+
 @replay_bp.route('/buffer/status', methods=['GET'])
 def get_buffer_status():
     """
-    retorna o status do buffer circular.
+    retorna o status do buffer circular de cada câmera (ou só de ?camera=nome).
     """
     try:
         logger.info("solicitação de status do buffer circular")
-        status = circular_buffer.get_buffer_info()
+        camera = request.args.get('camera')
+        if camera is None:
+            status = buffer_manager.get_info()
+        elif buffer_manager.get(camera) is not None:
+            status = {camera: buffer_manager.get(camera).get_buffer_info()}
+        else:
+            return jsonify({
+                'success': False,
+                'message': f'câmera não encontrada: {camera}'
+            }), 404
         
         return jsonify({
             'success': True,
@@ -288,25 +1000,177 @@ def get_buffer_status():
             'message': f'erro ao obter status do buffer: {str(e)}'
         }), 500
 
+@replay_bp.route('/buffer/live.m3u8', methods=['GET'])
+def get_live_playlist():
+    """
+    playlist HLS com janela deslizante dos segmentos do buffer circular
+    (da primeira câmera ou de ?camera=nome). os segmentos já são MPEG-TS,
+    então a prévia ao vivo não custa nenhuma codificação extra.
+    """
+    try:
+        camera = request.args.get('camera', buffer_manager.cameras[0])
+        buffer = buffer_manager.get(camera)
+        if buffer is None:
+            return jsonify({
+                'success': False,
+                'message': f'câmera não encontrada: {camera}'
+            }), 404
+
+        segments = buffer.get_live_segments()
+        query = f'?camera={camera}' if 'camera' in request.args else ''
+        target_duration = math.ceil(max([duration for _, duration, _ in segments], default=buffer.segment_duration))
+
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{target_duration}',
+            f'#EXT-X-MEDIA-SEQUENCE:{segments[0][0] if segments else 0}'
+        ]
+        # cada processo FFmpeg (geração) recomeça os timestamps: no modo por
+        # segmento isso acontece em todo segmento; no contínuo, só em reinícios.
+        # a sequência vem do anel e só cresce, como o HLS exige entre playlists
+        if segments:
+            lines.append(f'#EXT-X-DISCONTINUITY-SEQUENCE:{segments[0][2]}')
+        previous_sequence = None
+        for segment_id, duration, sequence in segments:
+            if previous_sequence is not None and sequence != previous_sequence:
+                lines.append('#EXT-X-DISCONTINUITY')
+            previous_sequence = sequence
+            lines.append(f'#EXTINF:{duration:.3f},')
+            lines.append(f'segment/{segment_id}.ts{query}')
+
+        response = Response('\n'.join(lines) + '\n', mimetype='application/vnd.apple.mpegurl')
+        response.cache_control.no_cache = True
+        return response
+
+    except Exception as e:
+        logger.error(f"erro ao gerar playlist ao vivo: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'erro ao gerar playlist ao vivo: {str(e)}'
+        }), 500
+
+class _ViewStream:
+    """
+    corpo da resposta de um segmento em memória, enviado em blocos. o servidor
+    chama close() no fim ou quando o cliente desconecta, mesmo que o envio nem
+    tenha começado (o que não acontece com o finally de um gerador).
+    """
+
+    def __init__(self, view, on_close):
+        self.view = view
+        self.on_close = on_close
+        self.sent_bytes = 0
+
+    def __iter__(self):
+        # os slices do memoryview não copiam; a cópia acontece só no bytes() de
+        # cada bloco, porque o WSGI (PEP 3333) exige bytes: o servidor do
+        # werkzeug falha com um assert e o gunicorn com TypeError se receberem
+        # um memoryview. o lease segura o slot até o close(), então o conteúdo
+        # não muda durante o envio e nunca há mais de um bloco copiado por vez
+        for start in range(0, len(self.view), LIVE_CHUNK_SIZE):
+            chunk = bytes(self.view[start:start + LIVE_CHUNK_SIZE])
+            yield chunk
+            # o servidor só pede o próximo bloco depois de escrever este
+            self.sent_bytes += len(chunk)
+
+    def close(self):
+        callback, self.on_close = self.on_close, None
+        if callback is not None:
+            callback(self.sent_bytes)
+
+def _lease_observer(lease):
+    """on_close que devolve o lease do segmento e registra o envio nas métricas"""
+    observe = _file_send_observer()
+
+    def on_close(sent_bytes):
+        lease.release()
+        observe(sent_bytes)
+    return on_close
+
+@replay_bp.route('/buffer/segment/<int:segment_id>.ts', methods=['GET'])
+def get_live_segment(segment_id):
+    """
+    serve um segmento do buffer circular para a prévia HLS, direto do disco ou da memória.
+    """
+    try:
+        camera = request.args.get('camera', buffer_manager.cameras[0])
+        buffer = buffer_manager.get(camera)
+        source, lease = buffer.acquire_segment(segment_id) if buffer is not None else (None, None)
+        if source is None:
+            return jsonify({
+                'success': False,
+                'message': 'segmento não está mais no buffer'
+            }), 404
+
+        # o segmento fica reservado até o fim do envio, para não ser descartado
+        # (ou ter o slot reaproveitado) enquanto o cliente lê
+        if isinstance(source, str):
+            try:
+                response = send_video(source, mimetype='video/mp2t', max_age=buffer.buffer_duration,
+                                      on_close=_lease_observer(lease))
+            except Exception:
+                lease.release()
+                raise
+            # 304, 416 e X-Sendfile não têm corpo, então on_close nunca é chamada
+            if not response.direct_passthrough:
+                lease.release()
+            return response
+
+        view = memoryview(source)
+        response = Response(_ViewStream(view, _lease_observer(lease)), mimetype='video/mp2t', direct_passthrough=True)
+        response.content_length = len(view)
+        response.cache_control.public = True
+        response.cache_control.max_age = buffer.buffer_duration
+        return response
+
+    except Exception as e:
+        logger.error(f"erro ao servir segmento {segment_id}: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'message': f'erro ao servir segmento: {str(e)}'
+        }), 500
+
 @replay_bp.route('/buffer/restart', methods=['POST'])
 def restart_buffer():
     """
-    reinicia o buffer circular.
+    reinicia o buffer circular de todas as câmeras (ou só de ?camera=nome).
     """
     try:
         logger.info("solicitação para reiniciar buffer circular")
+        camera = request.args.get('camera')
+        if camera is None:
+            buffers = dict(buffer_manager.buffers)
+        elif buffer_manager.get(camera) is not None:
+            buffers = {camera: buffer_manager.get(camera)}
+        else:
+            return jsonify({
+                'success': False,
+                'message': f'câmera não encontrada: {camera}'
+            }), 404
         
-        # Para o buffer atual
-        circular_buffer.stop_recording()
-        time.sleep(1)
+        # Para o buffer atual (stop_recording já espera o FFmpeg encerrar)
+        stopped = [name for name, buffer in buffers.items() if buffer.stop_recording()]
         
-        # Reinicia o buffer
-        circular_buffer.start_recording()
+        # Reinicia o buffer; o primeiro segmento chega em segundo plano (ver /health).
+        # uma câmera cuja thread de captura não encerrou a tempo fica parada: iniciar
+        # outra agora deixaria duas capturas gravando no mesmo buffer
+        for name in stopped:
+            buffers[name].start_recording()
+        busy = [name for name in buffers if name not in stopped]
+        if busy:
+            logger.warning(f"captura anterior ainda encerrando nas câmeras {busy}")
+            return jsonify({
+                'success': False,
+                'message': 'captura anterior ainda encerrando, tente novamente',
+                'cameras': busy
+            }), 409
         
         logger.info("Buffer circular reiniciado com sucesso")
         return jsonify({
             'success': True,
-            'message': 'buffer circular reiniciado com sucesso'
+            'message': 'buffer circular reiniciado com sucesso',
+            'ready': all(buffer.ready.is_set() for buffer in buffers.values())
         }), 200
         
     except Exception as e:
@@ -316,6 +1180,28 @@ def restart_buffer():
             'message': f'erro ao reiniciar buffer: {str(e)}'
         }), 500
 
+@replay_bp.route('/events', methods=['GET'])
+def stream_events():
+    """
+    canal Server-Sent Events com as mudanças do sistema de replay:
+    replay.saved, replay.error, replay.deleted, buffer.segment e buffer.error.
+    reconexões com Last-Event-ID recebem os eventos perdidos.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    stream = event_bus.subscribe(last_event_id)
+    if stream is None:
+        return jsonify({
+            'success': False,
+            'message': 'limite de conexões de eventos atingido'
+        }), 503
+    
+    logger.info(f"cliente conectado aos eventos - IP: {request.remote_addr}")
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # nginx não deve acumular a resposta em buffer
+        'X-Accel-Buffering': 'no'
+    })
+
 @replay_bp.route('/status', methods=['GET'])
 def get_status():
     """
@@ -328,15 +1214,11 @@ def get_status():
             Replay.timestamp >= datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         ).count()
         
-        # calcula uso de disco
-        disk_usage = 0
-        if os.path.exists(REPLAYS_DIR):
-            disk_usage = sum(os.path.getsize(os.path.join(REPLAYS_DIR, f)) 
-                           for f in os.listdir(REPLAYS_DIR) 
-                           if os.path.isfile(os.path.join(REPLAYS_DIR, f)))
+        # uso de disco mantido incrementalmente (sem varrer o diretório)
+        disk_usage = storage_accounting.get_usage()
         
         # status do buffer
-        buffer_status = circular_buffer.get_buffer_info()
+        buffer_status = buffer_manager.get_info()
         
         status_info = {
             'system': 'tamo online',
@@ -344,7 +1226,13 @@ def get_status():
             'today_replays': recent_replays,
             'storage_path': REPLAYS_DIR,
             'storage_usage_bytes': disk_usage,
-            'buffer_circular': buffer_status
+            'buffer_circular': buffer_status,
+            'replay_jobs': replay_jobs.get_info(),
+            'retention': retention_engine.get_info(),
+            'events': event_bus.get_info(),
+            'database': db_writer.get_info(),
+            'mp4_upgrade': mp4_upgrader.get_info(),
+            'renditions': rendition_transcoder.get_info()
         }
         
         logger.info(f"Status do sistema: {total_replays} replays total, {recent_replays} hoje")
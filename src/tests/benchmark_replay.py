@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+benchmark do sistema Rebote: captura, salvamento e rotas HTTP.
+
+usa o vídeo simulado (src/static/simulated_buffer_1min.mp4) como câmera e
+grava os resultados em JSON, para comparar versões:
+
+    python src/tests/benchmark_replay.py --output bench.json
+    python src/tests/benchmark_replay.py --skip-http --capture-seconds 20
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import threading
+import logging
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+try:
+    import resource  # não existe no Windows: sem medição de CPU
+except ImportError:
+    resource = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT_DIR)
+
+from src.utils.circular_buffer import CircularVideoBuffer
+
+logger = logging.getLogger("benchmark")
+
+SIMULATED_VIDEO = os.path.join(ROOT_DIR, "src", "static", "simulated_buffer_1min.mp4")
+# buffer de um servidor que pode estar rodando ao lado do benchmark
+REAL_BUFFER_DIR = os.path.join(ROOT_DIR, "src", "buffer")
+
+
+def directory_state(path):
+    """caminho relativo -> (tamanho, mtime) de todos os arquivos abaixo de path"""
+    state = {}
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            state[os.path.relpath(file_path, path)] = (stat.st_size, stat.st_mtime_ns)
+    return state
+
+
+def summarize(values):
+    """estatísticas de uma lista de medições (em segundos)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def percentile(p):
+        return ordered[min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "stdev": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "min": ordered[0],
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "max": ordered[-1]
+    }
+
+
+def cpu_times():
+    """(cpu deste processo, cpu dos processos filhos já encerrados) em segundos"""
+    if resource is None:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+def start_buffer(work_dir, name, buffer_duration, segment_duration, capture_mode, storage, event_callback=None):
+    buffer = CircularVideoBuffer(
+        buffer_duration=buffer_duration,
+        segment_duration=segment_duration,
+        video_source=SIMULATED_VIDEO,
+        output_dir=os.path.join(work_dir, name),
+        capture_mode=capture_mode,
+        storage=storage,
+        event_callback=event_callback
+    )
+    buffer.start_recording()
+    return buffer
+
+
+def wait_for_duration(buffer, seconds, timeout):
+    """aguarda o buffer acumular `seconds` segundos de vídeo"""
+    deadline = time.monotonic() + timeout
+    while buffer.get_available_duration() < seconds and time.monotonic() < deadline:
+        time.sleep(0.2)
+    return buffer.get_available_duration()
+
+
+def bench_capture(args, work_dir):
+    """jitter entre segmentos e CPU por segundo de vídeo capturado"""
+    logger.info(f"=== captura: {args.capture_seconds}s em modo {args.capture_mode} ===")
+    completions = []
+    durations = []
+
+    def on_event(event, data):
+        if event == "buffer.segment":
+            completions.append(time.monotonic())
+            durations.append(data["duration"])
+
+    cpu_before = cpu_times()
+    started = time.monotonic()
+    buffer = start_buffer(work_dir, "capture", args.capture_seconds + args.segment_duration,
+                          args.segment_duration, args.capture_mode, args.storage, on_event)
+    ready = buffer.wait_until_ready(timeout=args.capture_seconds)
+    time_to_ready = time.monotonic() - started if ready else None
+    time.sleep(max(args.capture_seconds - (time.monotonic() - started), 0))
+    buffer.stop_recording()
+    # o FFmpeg precisa ter sido aguardado para entrar em RUSAGE_CHILDREN
+    time.sleep(0.5)
+    cpu_after = cpu_times()
+
+    intervals = [b - a for a, b in zip(completions, completions[1:])]
+    gaps = [max(interval - duration, 0.0) for interval, duration in zip(intervals, durations[1:]) if duration]
+    captured = sum(duration for duration in durations if duration)
+
+    result = {
+        "segments": len(completions),
+        "captured_seconds": captured,
+        # do start_recording ao primeiro segmento no buffer
+        "time_to_ready": time_to_ready,
+        "segment_interval": summarize(intervals),
+        "segment_gap": summarize(gaps),
+        # jitter: desvio padrão do intervalo entre segmentos
+        "jitter": statistics.stdev(intervals) if len(intervals) > 1 else None
+    }
+    if cpu_before and cpu_after and captured:
+        result["cpu_seconds_per_video_second"] = {
+            "ffmpeg": (cpu_after[1] - cpu_before[1]) / captured,
+            "python": (cpu_after[0] - cpu_before[0]) / captured
+        }
+    logger.info(f"captura: {json.dumps(result)}")
+    return result
+
+
+def bench_save(args, work_dir):
+    """
+    latência de save_replay para cada tamanho de buffer (duração e número de
+    segmentos), duração de janela e formato
+    """
+    results = {}
+    for buffer_duration in args.buffer_durations:
+        for segment_duration in args.buffer_segment_durations:
+            key = f"{buffer_duration}s_{segment_duration}s_segments"
+            results[key] = _bench_save_buffer(args, work_dir, buffer_duration, segment_duration)
+    return results
+
+
+def _bench_save_buffer(args, work_dir, buffer_duration, segment_duration):
+    """latência de save_replay com o buffer cheio, em um tamanho de buffer"""
+    # janelas maiores que o buffer não têm vídeo suficiente
+    window_sizes = [window for window in args.save_windows if window <= buffer_duration] or [buffer_duration]
+    segment_count = -(-buffer_duration // segment_duration)
+    logger.info(f"=== salvamento: buffer de {buffer_duration}s em {segment_count} segmentos de {segment_duration}s, "
+                f"janelas {window_sizes}s, {args.save_repeats} repetições ===")
+    buffer = start_buffer(work_dir, f"save-{buffer_duration}-{segment_duration}", buffer_duration,
+                          segment_duration, args.capture_mode, args.storage)
+    try:
+        # com o buffer cheio o salvamento percorre todos os segmentos do anel
+        target = buffer_duration - segment_duration
+        available = wait_for_duration(buffer, target, timeout=target * 3 + 30)
+        results = {}
+        for window in window_sizes:
+            for output_format in ("ts", "mp4"):
+                latencies = []
+                failures = 0
+                for i in range(args.save_repeats):
+                    output_path = os.path.join(work_dir, f"save-{window}-{i}.{output_format}")
+                    start = time.perf_counter()
+                    saved = buffer.save_replay(output_path, seconds=window)
+                    elapsed = time.perf_counter() - start
+                    if saved:
+                        latencies.append(elapsed)
+                    else:
+                        failures += 1
+                    if os.path.exists(output_path):
+                        os.remove(output_path)
+                results[f"{window}s_{output_format}"] = {
+                    "latency": summarize(latencies),
+                    "failures": failures
+                }
+        result = {
+            "buffer_duration": buffer_duration,
+            "segment_duration": segment_duration,
+            "segments": segment_count,
+            "available_seconds": available,
+            "windows": results
+        }
+        logger.info(f"salvamento: {json.dumps(result)}")
+        return result
+    finally:
+        buffer.stop_recording()
+
+
+def _request(url, method="GET", timeout=60):
+    """faz uma requisição e retorna (status, bytes recebidos)"""
+    req = urllib.request.Request(url, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, len(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, len(e.read())
+
+
+def _load(name, url_fn, clients, requests_per_client, method="GET"):
+    """dispara requisições concorrentes e mede latência e vazão"""
+    latencies = []
+    statuses = {}
+    received = [0]
+    lock = threading.Lock()
+
+    def worker(client):
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            status, size = _request(url_fn(client, i), method=method)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                received[0] += size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(worker, range(clients)))
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "clients": clients,
+        "requests": len(latencies),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "requests_per_second": len(latencies) / elapsed if elapsed else None,
+        "bytes_per_second": received[0] / elapsed if elapsed else None,
+        "latency": summarize(latencies)
+    }
+    logger.info(f"http {name}: {json.dumps(result)}")
+    return result
+
+
+def bench_http(args, work_dir):
+    """vazão de /trigger, /list e /video com clientes concorrentes"""
+    # antes de importar as rotas, que criam os buffers das câmeras reais
+    real_buffer_before = directory_state(REAL_BUFFER_DIR)
+    from flask import Flask
+    from werkzeug.serving import make_server
+    from src.models.user import db
+    from src.models.replay import Replay
+    from src.utils.buffer_manager import BufferManager
+    from src.utils.sqlite_tuning import configure_sqlite
+    from src.utils.renditions import rendition_filename
+    from src.utils.thumbnail_cache import ThumbnailCache
+    import src.routes.replay as replay_routes
+
+    # o módulo de rotas configura o próprio logger ao ser importado
+    logging.getLogger("replay").setLevel(logging.WARNING)
+    logger.info(f"=== http: {args.clients} clientes ===")
+
+    # replays, thumbnails e banco no diretório temporário, para não mexer nos dados reais
+    replays_dir = os.path.join(work_dir, "replays")
+    os.makedirs(replays_dir, exist_ok=True)
+    replay_routes.REPLAYS_DIR = replays_dir
+    replay_routes.storage_accounting.directory = replays_dir
+    replay_routes.retention_engine.replays_dir = replays_dir
+    replay_routes.mp4_upgrader.directory = replays_dir
+    replay_routes.rendition_transcoder.directory = replays_dir
+    replay_routes.thumbnail_cache = ThumbnailCache(os.path.join(work_dir, "thumbnails"))
+
+    # troca a câmera configurada pelo vídeo simulado
+    replay_routes.REPLAY_FORMAT = args.replay_format
+    replay_routes.buffer_manager.shutdown()
+    replay_routes.buffer_manager = BufferManager({
+        "principal": dict(
+            buffer_duration=max(args.save_windows) + args.segment_duration,
+            segment_duration=args.segment_duration,
+            video_source=SIMULATED_VIDEO,
+            output_dir=os.path.join(work_dir, "http"),
+            capture_mode=args.capture_mode,
+            storage=args.storage
+        )
+    }, event_callback=replay_routes.event_bus.publish)
+
+    # aplicação própria com banco temporário (sem importar src.main, que abre o banco real)
+    app = Flask(__name__)
+    configure_sqlite(app, os.path.join(work_dir, "bench.db"))
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.register_blueprint(replay_routes.replay_bp, url_prefix="/api/replay")
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    replay_routes.db_writer.start(app)
+    if not args.renditions:
+        # os encodes das renditions disputariam CPU com a captura e as rotas medidas
+        replay_routes.rendition_transcoder.shutdown(wait=True)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/api/replay"
+
+    created_files = []
+    try:
+        replay_routes.buffer_manager.start_all()
+        wait_for_duration(replay_routes.buffer_manager.get("principal"), args.trigger_seconds,
+                          timeout=args.trigger_seconds * 3 + 30)
+
+        results = {}
+        results["trigger"] = _load(
+            "trigger", lambda client, i: f"{base_url}/trigger?seconds={args.trigger_seconds}",
+            args.clients, args.trigger_requests, method="POST")
+
+        # aguarda os jobs terminarem antes de medir as leituras
+        with app.app_context():
+            deadline = time.monotonic() + 120
+            while Replay.query.filter_by(status="processing").count() and time.monotonic() < deadline:
+                time.sleep(0.5)
+            saved = Replay.query.filter_by(status="saved").all()
+            saved_ids = [replay.id for replay in saved]
+            created_files = [os.path.join(replay_routes.REPLAYS_DIR, filename)
+                             for replay in Replay.query.all()
+                             for filename in (replay.filename, *(rendition_filename(replay.filename, name)
+                                                                 for name in replay.get_renditions()))]
+
+        results["list"] = _load(
+            "list", lambda client, i: f"{base_url}/list?limit=50", args.clients, args.read_requests)
+        if saved_ids:
+            results["video"] = _load(
+                "video", lambda client, i: f"{base_url}/video/{saved_ids[(client + i) % len(saved_ids)]}",
+                args.clients, args.read_requests)
+
+        # o benchmark não pode ter mexido no buffer de um servidor rodando ao lado
+        results["real_buffer_unchanged"] = directory_state(REAL_BUFFER_DIR) == real_buffer_before
+        if not results["real_buffer_unchanged"]:
+            logger.error(f"o benchmark alterou arquivos em {REAL_BUFFER_DIR}")
+        return results
+    finally:
+        server.shutdown()
+        replay_routes.buffer_manager.shutdown()
+        replay_routes.replay_jobs.shutdown(wait=True)
+        replay_routes.rendition_transcoder.shutdown(wait=True)
+        # remove os replays criados durante o benchmark
+        for file_path in created_files:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+
+def environment_info():
+    def command_output(cmd):
+        try:
+            return subprocess.run(cmd, capture_output=True, text=True, cwd=ROOT_DIR, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    ffmpeg_version = command_output(["ffmpeg", "-version"])
+    return {
+        "git_commit": command_output(["git", "rev-parse", "HEAD"]),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version.splitlines()[0] if ffmpeg_version else None
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="benchmark de captura, salvamento e rotas do Rebote")
+    parser.add_argument("--output", default="bench_results.json", help="arquivo JSON de saída")
+    parser.add_argument("--capture-mode", default="continuous", choices=["continuous", "per_segment"])
+    parser.add_argument("--storage", default="disk", choices=["disk", "memory"])
+    parser.add_argument("--segment-duration", type=int, default=2)
+    parser.add_argument("--capture-seconds", type=int, default=30)
+    parser.add_argument("--save-windows", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--buffer-durations", type=int, nargs="+", default=[20, 40],
+                        help="durações de buffer (s) medidas no salvamento")
+    parser.add_argument("--buffer-segment-durations", type=int, nargs="+", default=[1, 2],
+                        help="durações de segmento (s) medidas no salvamento; definem o número de segmentos do buffer")
+    parser.add_argument("--save-repeats", type=int, default=5)
+    parser.add_argument("--replay-format", default="mp4", choices=["mp4", "ts"], help="formato dos replays do /trigger")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--trigger-seconds", type=int, default=5)
+    parser.add_argument("--trigger-requests", type=int, default=2, help="triggers por cliente")
+    parser.add_argument("--read-requests", type=int, default=25, help="leituras por cliente")
+    parser.add_argument("--renditions", action="store_true", help="gera as renditions dos replays durante o /trigger")
+    parser.add_argument("--skip-capture", action="store_true")
+    parser.add_argument("--skip-save", action="store_true")
+    parser.add_argument("--skip-http", action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    # o benchmark só precisa dos próprios logs
+    for name in ("src", "werkzeug"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    args = parse_args()
+
+    if not os.path.exists(SIMULATED_VIDEO):
+        logger.error(f"vídeo simulado não encontrado: {SIMULATED_VIDEO}")
+        return 1
+
+    work_dir = tempfile.mkdtemp(prefix="rebote-bench-")
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "environment": environment_info(),
+        "config": vars(args),
+        "results": {}
+    }
+    try:
+        if not args.skip_capture:
+            report["results"]["capture"] = bench_capture(args, work_dir)
+        if not args.skip_save:
+            report["results"]["save"] = bench_save(args, work_dir)
+        if not args.skip_http:
+            report["results"]["http"] = bench_http(args, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report["finished_at"] = datetime.now(timezone.utc).isoformat()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"resultados salvos em {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
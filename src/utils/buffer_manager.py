@@ -0,0 +1,129 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.circular_buffer import CircularVideoBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class BufferManager:
+    """
+    gerencia um CircularVideoBuffer por câmera (ângulo da quadra).
+    cada buffer tem sua própria configuração, thread de gravação e processo FFmpeg.
+    """
+
+    def __init__(self, cameras, event_callback=None):
+        """
+        Args:
+            cameras: dicionário nome da câmera -> argumentos do CircularVideoBuffer
+            event_callback: função (evento, dados) que recebe os eventos de todos
+                os buffers, com o nome da câmera em dados["camera"]
+        """
+        if not cameras:
+            raise ValueError("nenhuma câmera configurada")
+
+        self.event_callback = event_callback
+        self.buffers = {
+            name: CircularVideoBuffer(**config, event_callback=self._camera_callback(name))
+            for name, config in cameras.items()
+        }
+
+        # salvamentos das câmeras rodam em paralelo; folga para dois triggers simultâneos
+        self._executor = ThreadPoolExecutor(max_workers=len(self.buffers) * 2, thread_name_prefix="buffer-save")
+
+        logger.info(f"gerenciador de buffers inicializado com {len(self.buffers)} câmera(s): "
+                    f"{', '.join(self.buffers)}")
+
+    def _camera_callback(self, camera):
+        if self.event_callback is None:
+            return None
+        return lambda event, data: self.event_callback(event, dict(data, camera=camera))
+
+    @property
+    def cameras(self):
+        """nomes das câmeras configuradas"""
+        return list(self.buffers)
+
+    @property
+    def is_recording(self):
+        """True se pelo menos uma câmera estiver gravando"""
+        return any(buffer.is_recording for buffer in self.buffers.values())
+
+    @property
+    def is_ready(self):
+        """True se todas as câmeras que estão gravando já têm pelo menos um segmento"""
+        recording = [buffer for buffer in self.buffers.values() if buffer.is_recording]
+        return bool(recording) and all(buffer.ready.is_set() for buffer in recording)
+
+    def wait_until_ready(self, timeout=None):
+        """aguarda o primeiro segmento de todas as câmeras; retorna True se todas ficaram prontas"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for buffer in self.buffers.values():
+            remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+            if not buffer.wait_until_ready(remaining):
+                return False
+        return True
+
+    def get(self, camera):
+        """retorna o buffer de uma câmera (ou None)"""
+        return self.buffers.get(camera)
+
+    def start_all(self):
+        """inicia a gravação de todas as câmeras sem esperar o primeiro segmento"""
+        results = {}
+        for name, buffer in self.buffers.items():
+            results[name] = buffer.start_recording()
+            if not results[name]:
+                logger.error(f"falha ao iniciar a gravação da câmera {name}")
+        return results
+
+    def stop_all(self):
+        """para a gravação de todas as câmeras"""
+        for buffer in self.buffers.values():
+            buffer.stop_recording()
+
+    def save_all(self, output_paths, seconds=None, until=None):
+        """
+        salva o mesmo momento de todas as câmeras em paralelo.
+
+        Args:
+            output_paths: dicionário nome da câmera -> caminho do replay
+            seconds: duração do replay em segundos (buffer inteiro se None)
+            until: horário unix em que a janela termina (o trigger); agora se None
+
+        retorna um dicionário nome da câmera -> (início, fim) da janela salva, em
+        horário unix, ou None se o replay da câmera falhou
+        """
+        # todas as câmeras cortam a janela no mesmo instante
+        if until is None:
+            until = time.time()
+
+        futures = {}
+        for name, output_path in output_paths.items():
+            buffer = self.buffers.get(name)
+            if buffer is None:
+                logger.error(f"câmera desconhecida: {name}")
+                continue
+            futures[name] = self._executor.submit(buffer.save_replay, output_path, seconds, until)
+
+        results = {name: None for name in output_paths}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"erro ao salvar replay da câmera {name}: {e}")
+        return results
+
+    def get_available_duration(self):
+        """menor duração disponível entre as câmeras que estão gravando"""
+        durations = [buffer.get_available_duration() for buffer in self.buffers.values() if buffer.is_recording]
+        return min(durations) if durations else 0
+
+    def get_info(self):
+        """retorna o estado do buffer de cada câmera"""
+        return {name: buffer.get_buffer_info() for name, buffer in self.buffers.items()}
+
+    def shutdown(self):
+        """para todas as câmeras e encerra o pool de salvamento"""
+        self.stop_all()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,184 @@
+import os
+import time
+import threading
+import subprocess
+import logging
+from collections import deque
+from src.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_STALLS_TOTAL = REGISTRY.counter(
+    "rebote_capture_stalls_total", "FFmpeg encerrados por ficarem sem progresso", ["buffer"])
+CAPTURE_RESTARTS_TOTAL = REGISTRY.counter(
+    "rebote_capture_restarts_total", "reinícios da captura depois de uma falha ou travamento", ["buffer"])
+CAPTURE_RECOVERY_SECONDS = REGISTRY.histogram(
+    "rebote_capture_recovery_seconds", "tempo do último progresso antes de uma falha até o próximo segmento",
+    ["buffer"], buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300, 600))
+
+
+class CaptureSupervisor:
+    """
+    vigia o processo FFmpeg da captura.
+
+    uma thread lê o stderr para um anel limitado de linhas (diagnóstico sem
+    encher a memória nem travar o FFmpeg com o pipe cheio) e outra confere o
+    progresso a cada `check_interval` segundos: um segmento novo ou o arquivo
+    em gravação crescendo. sem progresso por `stall_timeout` segundos (câmera
+    congelada, driver travado) o processo é encerrado para que a captura
+    reinicie. falhas seguidas esperam um tempo crescente (backoff exponencial)
+    antes do próximo reinício, e o tempo até voltar a gravar vira métrica.
+    """
+
+    def __init__(self, name, stall_timeout, check_interval=1.0, backoff_base=1.0, backoff_max=30.0,
+                 stderr_lines=50):
+        """
+        Args:
+            name: nome do buffer, usado nas métricas e nos logs
+            stall_timeout: segundos sem progresso até o FFmpeg ser considerado travado
+            check_interval: intervalo em segundos entre as verificações de progresso
+            backoff_base / backoff_max: espera inicial e máxima em segundos entre reinícios
+            stderr_lines: linhas do stderr do FFmpeg mantidas para diagnóstico
+        """
+        self.name = name
+        self.stall_timeout = stall_timeout
+        self.check_interval = check_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._stderr = deque(maxlen=stderr_lines)
+        self._last_progress = None
+        self._stalled = False
+
+        self._failures = 0  # falhas seguidas, zeradas no próximo segmento
+        self._failed_at = None  # último progresso antes da falha atual
+        self.stalls = 0
+        self.restarts = 0
+        self.last_error = None
+        self.last_recovery = None
+
+    def reset(self):
+        """prepara para uma nova gravação"""
+        self._stop_event.clear()
+        with self._lock:
+            self._failures = 0
+            self._failed_at = None
+
+    def cancel(self):
+        """interrompe a vigilância e qualquer espera de backoff (fim da gravação)"""
+        self._stop_event.set()
+
+    def watch(self, process, current_path):
+        """
+        começa a vigiar um processo recém-iniciado (com stderr=PIPE).
+
+        Args:
+            process: subprocess.Popen do FFmpeg
+            current_path: função que retorna o caminho do segmento em gravação
+        """
+        with self._lock:
+            self._last_progress = time.monotonic()
+            self._stalled = False
+        self._stderr.clear()
+        threading.Thread(target=self._read_stderr, args=(process,), name=f"ffmpeg-stderr-{self.name}",
+                         daemon=True).start()
+        threading.Thread(target=self._watchdog, args=(process, current_path), name=f"capture-watchdog-{self.name}",
+                         daemon=True).start()
+
+    def _read_stderr(self, process):
+        try:
+            for line in process.stderr:
+                if isinstance(line, bytes):
+                    line = line.decode(errors="replace")
+                line = line.rstrip()
+                if line:
+                    self._stderr.append(line)
+        except (OSError, ValueError):
+            # pipe fechado junto com o processo
+            pass
+
+    def _watchdog(self, process, current_path):
+        last_size = None
+        while process.poll() is None and not self._stop_event.wait(self.check_interval):
+            try:
+                size = os.path.getsize(current_path())
+            except OSError:
+                size = None
+            now = time.monotonic()
+            with self._lock:
+                if size is not None and size != last_size:
+                    self._last_progress = now
+                last_size = size
+                idle = now - self._last_progress
+            if idle < self.stall_timeout:
+                continue
+
+            with self._lock:
+                self._stalled = True
+                self.stalls += 1
+            CAPTURE_STALLS_TOTAL.inc(buffer=self.name)
+            logger.warning(f"captura {self.name} sem progresso há {idle:.0f}s, encerrando o FFmpeg")
+            process.terminate()
+            try:
+                process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            return
+
+    def segment_completed(self):
+        """registra um segmento novo; encerra a falha em andamento, se houver"""
+        now = time.monotonic()
+        with self._lock:
+            self._last_progress = now
+            failed_at, self._failed_at = self._failed_at, None
+            self._failures = 0
+            if failed_at is None:
+                return
+            recovery = now - failed_at
+            self.last_recovery = recovery
+        CAPTURE_RECOVERY_SECONDS.observe(recovery, buffer=self.name)
+        logger.info(f"captura {self.name} recuperada em {recovery:.1f}s")
+
+    @property
+    def stalled(self):
+        """True se o último processo foi encerrado por falta de progresso"""
+        with self._lock:
+            return self._stalled
+
+    def process_failed(self, message):
+        """
+        registra o fim inesperado do FFmpeg e retorna quantos segundos esperar
+        antes de reiniciar
+        """
+        with self._lock:
+            if self._failed_at is None:
+                self._failed_at = self._last_progress or time.monotonic()
+            self._failures += 1
+            self.restarts += 1
+            self.last_error = message
+            delay = min(self.backoff_base * 2 ** (self._failures - 1), self.backoff_max)
+        CAPTURE_RESTARTS_TOTAL.inc(buffer=self.name)
+        return delay
+
+    def wait_backoff(self, delay):
+        """espera o backoff; retorna False se a gravação foi encerrada durante a espera"""
+        return not self._stop_event.wait(delay)
+
+    def stderr_tail(self, lines=10):
+        """últimas linhas do stderr do FFmpeg"""
+        return list(self._stderr)[-lines:]
+
+    def get_info(self):
+        with self._lock:
+            return {
+                "stall_timeout": self.stall_timeout,
+                "consecutive_failures": self._failures,
+                "failing_for": time.monotonic() - self._failed_at if self._failed_at is not None else None,
+                "stalls": self.stalls,
+                "restarts": self.restarts,
+                "last_error": self.last_error,
+                "last_recovery_seconds": self.last_recovery,
+                "stderr": list(self._stderr)[-10:]
+            }
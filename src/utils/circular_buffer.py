@@ -4,13 +4,45 @@ import threading
 import time
 from datetime import datetime
 import logging
-from collections import deque
 import glob
+import json
+import re
+from src.utils.mpegts import TS_CLOCK, concat_segments, index_segment, write_concatenated
+from src.utils.segment_storage import DiskSegmentStorage, MemorySegmentStorage
+from src.utils.segment_ring import SegmentRing
+from src.utils.metrics import REGISTRY
+from src.utils.encoder_profiles import AdaptiveEncoder, read_process_cpu_seconds
+from src.utils.capture_supervisor import CaptureSupervisor
+from src.utils.mp4_layout import mp4_output_args
 
 logger = logging.getLogger(__name__)
 
+# estado do anel gravado no diretório dos segmentos, lido ao reiniciar
+JOURNAL_FILENAME = "ring.json"
+
+# faixas dos histogramas de segmentos, próximas das durações usuais de segmento
+SEGMENT_BUCKETS = (0.5, 1, 2, 3, 5, 7.5, 10, 12.5, 15, 20, 30, 60)
+
+SEGMENTS_TOTAL = REGISTRY.counter(
+    "rebote_segments_total", "segmentos finalizados e adicionados ao buffer", ["buffer"])
+SEGMENT_SECONDS = REGISTRY.histogram(
+    "rebote_segment_seconds", "tempo real para produzir cada segmento (encode incluso)", ["buffer"],
+    buckets=SEGMENT_BUCKETS)
+SEGMENT_GAP_SECONDS = REGISTRY.histogram(
+    "rebote_segment_gap_seconds", "tempo real entre segmentos além da duração do vídeo gravado", ["buffer"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10))
+CAPTURE_ERRORS_TOTAL = REGISTRY.counter(
+    "rebote_capture_errors_total", "falhas do FFmpeg durante a captura", ["buffer"])
+REPLAY_SAVE_SECONDS = REGISTRY.histogram(
+    "rebote_replay_save_seconds", "tempo para salvar um replay a partir do buffer", ["buffer", "format"])
+REPLAY_SAVES_TOTAL = REGISTRY.counter(
+    "rebote_replay_saves_total", "replays salvos a partir do buffer, por resultado", ["buffer", "result"])
+
 class CircularVideoBuffer:
-    def __init__(self, buffer_duration=30, segment_duration=5, video_source="USB CAMERA", output_dir="buffer"):
+    def __init__(self, buffer_duration=30, segment_duration=5, video_source="USB CAMERA", output_dir="buffer",
+                 capture_mode="continuous", keyframe_interval=1, storage="disk", event_callback=None,
+                 adaptive_encoding=True, encoder_options=None, video_codec="auto", stall_timeout=None,
+                 mp4_mode="faststart"):
         """
         inicializa o buffer circular de vídeo
         
@@ -19,37 +51,116 @@ class CircularVideoBuffer:
             segment_duration: Duração de cada segmento em segundos (padrão: 5s)
             video_source: Fonte de vídeo (webcam ou arquivo)
             output_dir: Diretório para armazenar os segmentos
+            capture_mode: "continuous" (um único FFmpeg com o muxer de segmentos)
+                ou "per_segment" (um processo FFmpeg por segmento, modo antigo)
+            keyframe_interval: intervalo entre keyframes em segundos; define a
+                precisão do corte ao salvar replays com duração exata
+            storage: "disk" (segmentos em output_dir) ou "memory" (slots
+                pré-alocados em RAM, sem escrita em disco até salvar um replay)
+            event_callback: função (evento, dados) chamada quando um segmento
+                entra no buffer ou a captura falha
+            adaptive_encoding: ajusta preset/resolução/framerate conforme o encode
+                acompanha (ou não) o tempo real
+            encoder_options: argumentos do AdaptiveEncoder (perfis, perfil
+                inicial e limites min_profile/max_profile)
+            video_codec: "auto" (copia o H.264 da fonte quando possível, senão
+                codifica), "copy" (sempre copia) ou "encode" (sempre codifica)
+            stall_timeout: segundos sem progresso até o FFmpeg ser reiniciado
+                (padrão: duas vezes a duração do segmento, no mínimo 10s)
+            mp4_mode: layout dos replays .mp4: "faststart" (moov no início) ou
+                "fragmented" (fragmentos a cada keyframe); nos dois o vídeo
+                começa a tocar antes de ser baixado inteiro
         """
+        if capture_mode not in ("continuous", "per_segment"):
+            raise ValueError(f"modo de captura inválido: {capture_mode}")
+        if video_codec not in ("auto", "copy", "encode"):
+            raise ValueError(f"modo de vídeo inválido: {video_codec}")
+        if storage not in ("disk", "memory"):
+            raise ValueError(f"armazenamento inválido: {storage}")
+
         self.buffer_duration = buffer_duration
         self.segment_duration = segment_duration
         self.video_source = video_source
         self.output_dir = output_dir
+        self.capture_mode = capture_mode
+        self.keyframe_interval = keyframe_interval
+        self.event_callback = event_callback
+        self.adaptive_encoding = adaptive_encoding
+        # valida o modo já na criação do buffer
+        mp4_output_args(mp4_mode)
+        self.mp4_mode = mp4_mode
+        # "auto" é resolvido para "copy" ou "encode" ao iniciar a gravação
+        self.video_codec = video_codec
+        self.video_codec_mode = None if video_codec == "auto" else video_codec
+        self.source_codec = None
+        self.dshow_input_codec = None
+        self._codec_probed = False
+        self.encoder = AdaptiveEncoder(**(encoder_options or {}))
+        # nome usado nas métricas (o diretório de cada câmera tem o nome dela)
+        self.name = os.path.basename(os.path.abspath(output_dir))
         self.max_segments = buffer_duration // segment_duration
+        self.supervisor = CaptureSupervisor(
+            self.name, stall_timeout=stall_timeout or max(2 * segment_duration, 10))
+        
+        # onde os segmentos ficam entre a gravação e o descarte; na memória,
+        # duas posições extras: o segmento em gravação e uma folga para leituras
+        if storage == "memory":
+            self.storage = MemorySegmentStorage(slots=self.max_segments + 2, name=self.name)
+        else:
+            self.storage = DiskSegmentStorage(output_dir)
         
-        # deck para manter os segmentos em ordem
-        self.segments = deque(maxlen=self.max_segments)
+        # segmentos em ordem com o índice de cada um (PTS inicial/final, duração
+        # e keyframes). os nomes dos arquivos nunca se repetem, então um segmento
+        # em uso por um salvamento não é sobrescrito pelo FFmpeg
+        self.ring = SegmentRing(self.max_segments, on_evict=self._release_segment)
         
         self.is_recording = False
         self.ffmpeg_process = None
         self.segment_counter = 0
         self.recording_thread = None
+        self._last_segment_at = None
+        
+        # cada processo FFmpeg é uma geração: segmentos de gerações diferentes
+        # não têm timestamps contínuos (reinício da captura ou troca de perfil)
+        self.capture_generation = 0
+        self._new_process = True
+
+        # posição atual de leitura quando a fonte é um arquivo (modo por segmento),
+        # para que segmentos consecutivos continuem o vídeo em vez de repeti-lo
+        self.source_offset = 0.0
+        self.source_duration = None
+        
+        # sinalizado quando o buffer tem pelo menos um segmento durante a gravação
+        self.ready = threading.Event()
         
         # cria o diretório se não existir
         os.makedirs(output_dir, exist_ok=True)
         
-        # adiciona um pequeno atraso para garantir que o processo anterior liberou os arquivos
-        time.sleep(1)
-        
-        # limpa segmentos antigos
-        self._cleanup_old_segments()
+        # no disco, os segmentos sobrevivem a um reinício e são re-adotados;
+        # na memória não há o que recuperar
+        self.journal_path = os.path.join(output_dir, JOURNAL_FILENAME) if storage == "disk" else None
+        self.recovered_segments = 0
+        # a recuperação mexe nos arquivos do diretório, então só acontece ao
+        # começar a gravar: criar o buffer não afeta outra instância gravando ali
+        self._storage_prepared = False
         
         logger.info(f"buffer circular inicializado - duração total: {buffer_duration}s, "
                    f"segmentos de {segment_duration}s, máximo de {self.max_segments} segmentos")
     
+    def _prepare_storage(self):
+        """na primeira gravação, re-adota (disco) ou remove (memória) os segmentos de uma execução anterior"""
+        if self._storage_prepared:
+            return
+        self._storage_prepared = True
+        if self.journal_path:
+            self._recover_segments()
+        else:
+            self._cleanup_old_segments()
+
     def _cleanup_old_segments(self):
         """remove todos os segmentos antigos do diretório"""
         try:
-            pattern = os.path.join(self.output_dir, "segment_*.ts")
+            pattern = os.path.join(self.storage.capture_dir, "segment_*.ts")
             old_files = glob.glob(pattern)
             for file in old_files:
                 try:
@@ -60,12 +171,440 @@ class CircularVideoBuffer:
         except Exception as e:
             logger.error(f"erro ao limpar segmentos antigos: {e}")
     
+    def _recover_segments(self):
+        """
+        re-adota os segmentos de uma execução anterior (reinício ou queda do
+        processo): os mais novos que ainda cabem no buffer, estão no journal e
+        têm vídeo indexável voltam para o anel, e a numeração continua do maior
+        índice encontrado. o resto é removido.
+        """
+        files = {}
+        for path in glob.glob(os.path.join(self.storage.capture_dir, "segment_*.ts")):
+            match = re.fullmatch(r"segment_(\d+)\.ts", os.path.basename(path))
+            if match:
+                files[int(match.group(1))] = path
+        if not files:
+            return
+
+        # continua depois de todos os arquivos, inclusive o que estava em gravação
+        self.segment_counter = max(files) + 1
+        journal = self._read_journal()
+        # segmentos mais velhos que o buffer já teriam sido descartados
+        cutoff = time.time() - self.buffer_duration
+
+        adopted = []
+        for segment_id in sorted(files, reverse=True):
+            if len(adopted) >= self.max_segments:
+                break
+            if journal is not None:
+                entry = journal.get(segment_id)
+                if entry is None:
+                    # ainda estava sendo gravado quando o processo parou
+                    continue
+                completed_at, generation = entry["completed_at"], entry["generation"]
+            else:
+                # journal ausente ou ilegível: usa o horário do arquivo e uma geração só
+                completed_at, generation = os.path.getmtime(files[segment_id]), 1
+            if completed_at < cutoff:
+                break
+            index = self._index_segment(segment_id)
+            if index is None:
+                continue
+            index["completed_at"] = completed_at
+            index["generation"] = generation
+            adopted.append((segment_id, index))
+
+        adopted.reverse()
+        for segment_id, index in adopted:
+            self.ring.push(segment_id, index)
+
+        adopted_ids = {segment_id for segment_id, _ in adopted}
+        for segment_id, path in files.items():
+            if segment_id not in adopted_ids:
+                self.storage.evict(segment_id, path)
+
+        if adopted:
+            # a próxima captura é um processo novo, com geração maior que as adotadas
+            self.capture_generation = max(index["generation"] for _, index in adopted)
+            self.recovered_segments = len(adopted)
+            logger.info(f"{len(adopted)} segmentos re-adotados de uma execução anterior "
+                        f"({self.get_available_duration():.1f}s), numeração continua em {self.segment_counter}")
+        self._write_journal()
+
+    def _read_journal(self):
+        """retorna id do segmento -> {completed_at, generation}, ou None se não houver journal válido"""
+        try:
+            with open(self.journal_path) as f:
+                entries = json.load(f)["segments"]
+            return {int(entry["id"]): entry for entry in entries}
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"journal do buffer ilegível ({self.journal_path}): {e}")
+            return None
+
+    def _write_journal(self):
+        """grava os segmentos do anel; a troca pelo arquivo novo é atômica"""
+        if self.journal_path is None:
+            return
+        entries = [
+            {"id": segment_id, "completed_at": index["completed_at"], "generation": index["generation"]}
+            for segment_id, index in self.ring.snapshot() if index
+        ]
+        tmp_path = self.journal_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"segments": entries}, f)
+            os.replace(tmp_path, self.journal_path)
+        except OSError as e:
+            logger.warning(f"não foi possível gravar o journal do buffer: {e}")
+
     def _get_segment_path(self, segment_id):
         """retorna o caminho para um segmento específico"""
-        return os.path.join(self.output_dir, f"segment_{segment_id:06d}.ts")
-    
+        return os.path.join(self.storage.capture_dir, f"segment_{segment_id:06d}.ts")
+
+    def _add_segment(self, segment_id):
+        """adiciona um segmento finalizado ao buffer, descartando o mais antigo se necessário"""
+        if not self.storage.commit(segment_id, self._get_segment_path(segment_id)):
+            logger.error(f"segmento {segment_id} não pôde ser armazenado")
+            return
+
+        index = self._index_segment(segment_id)
+
+        if self._new_process:
+            self.capture_generation += 1
+            self._new_process = False
+
+        if index:
+            index["completed_at"] = time.time()
+            index["generation"] = self.capture_generation
+        self.ring.push(segment_id, index)
+        self._write_journal()
+        logger.debug(f"segmento {segment_id} adicionado ao buffer")
+        self._observe_segment(index)
+        self.supervisor.segment_completed()
+        self._emit("buffer.segment", {
+            "segment_id": segment_id,
+            "duration": index["duration"] if index else None,
+            "segments": len(self.ring)
+        })
+        if self.is_recording and not self.ready.is_set():
+            self.ready.set()
+            logger.info("buffer circular pronto: primeiro segmento gravado")
+            self._emit("buffer.ready", {"segment_id": segment_id})
+
+    def _release_segment(self, segment_id):
+        """descarta um segmento que saiu do anel e não está mais em uso"""
+        self.storage.evict(segment_id, self._get_segment_path(segment_id))
+
+    def _observe_segment(self, index):
+        """métricas de cadência: tempo entre segmentos e quanto disso não virou vídeo"""
+        now = time.monotonic()
+        SEGMENTS_TOTAL.inc(buffer=self.name)
+        if self._last_segment_at is not None:
+            elapsed = now - self._last_segment_at
+            SEGMENT_SECONDS.observe(elapsed, buffer=self.name)
+            if index:
+                SEGMENT_GAP_SECONDS.observe(max(elapsed - index["duration"], 0.0), buffer=self.name)
+        self._last_segment_at = now
+
+    def _adapt_encoder(self, segment_id, wall_seconds, cpu_seconds=None):
+        """
+        informa ao AdaptiveEncoder quanto tempo o segmento levou para ser produzido.
+        retorna True se o perfil mudou.
+        """
+        if not self.adaptive_encoding or self.video_codec_mode == "copy":
+            return False
+        index = self.ring.get(segment_id)
+        if not index:
+            return False
+        changed = self.encoder.observe(index["duration"], wall_seconds, cpu_seconds)
+        if changed:
+            self._emit("buffer.encoder", {"profile": self.encoder.profile["name"], "reason": self.encoder.last_reason})
+        return changed
+
+    def _emit(self, event, data):
+        """avisa o event_callback sem deixar um erro dele parar a gravação"""
+        if event == "buffer.error":
+            CAPTURE_ERRORS_TOTAL.inc(buffer=self.name)
+        if self.event_callback is None:
+            return
+        try:
+            self.event_callback(event, data)
+        except Exception as e:
+            logger.warning(f"erro ao publicar evento {event}: {e}")
+
+    def _index_segment(self, segment_id):
+        """lê um segmento recém-finalizado e monta seu índice de PTS e keyframes"""
+        segment_path = self._get_segment_path(segment_id)
+        data = self.storage.read(segment_id, segment_path)
+        if data is None:
+            logger.warning(f"não foi possível indexar o segmento {segment_path}")
+            return None
+        index = index_segment(data)
+        if index is None:
+            logger.warning(f"segmento {segment_path} sem vídeo com timestamps")
+        return index
+
+    def _probe_source_duration(self):
+        """retorna a duração do arquivo de origem em segundos (ou None se não for possível obter)"""
+        try:
+            result = subprocess.run(
+                [
+                    "ffprobe",
+                    "-v", "error",
+                    "-show_entries", "format=duration",
+                    "-of", "default=noprint_wrappers=1:nokey=1",
+                    self.video_source
+                ],
+                capture_output=True,
+                text=True,
+                timeout=10
+            )
+            duration = float(result.stdout.strip())
+            return duration if duration > 0 else None
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            logger.warning(f"não foi possível obter a duração de {self.video_source}: {e}")
+            return None
+
+    def _advance_source_offset(self):
+        """avança a posição de leitura do arquivo de origem em um segmento"""
+        self.source_offset += self.segment_duration
+        if self.source_duration:
+            self.source_offset %= self.source_duration
+
+    def _probe_file_codec(self):
+        """retorna (codec, pix_fmt) do vídeo do arquivo de origem, ou (None, None)"""
+        try:
+            result = subprocess.run(
+                [
+                    "ffprobe",
+                    "-v", "error",
+                    "-select_streams", "v:0",
+                    "-show_entries", "stream=codec_name,pix_fmt",
+                    "-of", "default=noprint_wrappers=1",
+                    self.video_source
+                ],
+                capture_output=True,
+                text=True,
+                timeout=10
+            )
+            fields = dict(line.split("=", 1) for line in result.stdout.splitlines() if "=" in line)
+            return fields.get("codec_name"), fields.get("pix_fmt")
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"não foi possível identificar o codec de {self.video_source}: {e}")
+            return None, None
+
+    def _probe_dshow_codecs(self):
+        """codecs comprimidos que a câmera oferece (ex.: {"h264", "mjpeg"})"""
+        try:
+            result = subprocess.run(
+                ["ffmpeg", "-hide_banner", "-f", "dshow", "-list_options", "true", "-i", f"video={self.video_source}"],
+                capture_output=True,
+                text=True,
+                timeout=15
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"não foi possível listar os formatos da câmera {self.video_source}: {e}")
+            return set()
+        # as opções saem no stderr, ex.: "vcodec=h264  min s=1920x1080 fps=30 ..."
+        return set(re.findall(r"vcodec=(\w+)", result.stderr))
+
+    def _resolve_video_codec(self):
+        """
+        decide se a captura copia o vídeo da fonte ou codifica com libx264.
+        só H.264 em 4:2:0 pode ser copiado para os segmentos .ts e tocar no
+        navegador; MJPEG ainda precisa de encode, mas pedir MJPEG à câmera
+        permite resoluções e framerates maiores pelo USB.
+        """
+        if os.path.isfile(self.video_source):
+            codec, pix_fmt = self._probe_file_codec()
+            self.source_codec = codec
+            can_copy = codec == "h264" and pix_fmt in ("yuv420p", "yuvj420p")
+        else:
+            codecs = self._probe_dshow_codecs()
+            if "h264" in codecs:
+                self.dshow_input_codec = "h264"
+            elif "mjpeg" in codecs:
+                self.dshow_input_codec = "mjpeg"
+            self.source_codec = self.dshow_input_codec
+            can_copy = self.dshow_input_codec == "h264"
+
+        if self.video_codec == "auto":
+            self.video_codec_mode = "copy" if can_copy else "encode"
+        elif self.video_codec == "copy" and not can_copy:
+            logger.warning(f"fonte com codec {self.source_codec}, a cópia direta pode falhar")
+        self._codec_probed = True
+        logger.info(f"vídeo da fonte: {self.source_codec or 'desconhecido'}, modo de captura do vídeo: {self.video_codec_mode}")
+
+    def _fall_back_to_encode(self, reason):
+        """volta a codificar quando a cópia direta não funciona com a fonte"""
+        if self.video_codec_mode != "copy" or self.video_codec != "auto":
+            return False
+        logger.warning(f"cópia direta do vídeo falhou ({reason}), passando a codificar com libx264")
+        self.video_codec_mode = "encode"
+        return True
+
+    def _dshow_input_args(self):
+        args = ["-f", "dshow"]
+        if self.dshow_input_codec:
+            args += ["-vcodec", self.dshow_input_codec]
+        return args + ["-i", f"video={self.video_source}"]
+
+    def _build_input_args(self):
+        """monta os argumentos de entrada do FFmpeg para o modo contínuo"""
+        if os.path.isfile(self.video_source):
+            # -re lê o arquivo no ritmo real, como se fosse uma câmera
+            return ["-re", "-stream_loop", "-1", "-i", self.video_source]
+        return self._dshow_input_args()
+
+    def _build_video_args(self):
+        """argumentos de saída do vídeo: cópia direta ou encode com keyframes regulares"""
+        if self.video_codec_mode == "copy":
+            # sem encode não há como forçar keyframes: os cortes seguem o GOP da câmera
+            return ["-c:v", "copy"]
+        return [
+            *self.encoder.ffmpeg_args(),
+            "-pix_fmt", "yuv420p",
+            # keyframes regulares para cortes precisos (e em cada fronteira de segmento)
+            "-force_key_frames", f"expr:gte(t,n_forced*{self.keyframe_interval})"
+        ]
+
     def _record_segments(self):
         """thread para gravação contínua de segmentos"""
+        if not self._codec_probed:
+            self._resolve_video_codec()
+        if self.capture_mode == "continuous":
+            self._record_continuous()
+        else:
+            self._record_per_segment()
+
+    def _record_continuous(self):
+        """
+        mantém um único processo FFmpeg com o muxer de segmentos.
+        a lista de segmentos (csv) vai para o stdout e cada linha indica um
+        segmento finalizado, então não há intervalo entre segmentos nem custo
+        de abrir a câmera e o encoder a cada N segundos.
+        """
+        segment_pattern = os.path.join(self.storage.capture_dir, "segment_%06d.ts")
+
+        while self.is_recording:
+            ffmpeg_cmd = [
+                "ffmpeg",
+                "-hide_banner",
+                "-nostats",
+                "-loglevel", "error",
+                *self._build_input_args(),
+                *self._build_video_args(),
+                "-f", "segment",
+                "-segment_time", str(self.segment_duration),
+                "-segment_format", "mpegts",
+                "-segment_start_number", str(self.segment_counter),
+                "-reset_timestamps", "0",
+                "-segment_list", "pipe:1",
+                "-segment_list_type", "csv",
+                "-y",
+                segment_pattern
+            ]
+
+            logger.debug(f"iniciando captura contínua: {' '.join(ffmpeg_cmd)}")
+
+            try:
+                self._new_process = True
+                self.ffmpeg_process = subprocess.Popen(
+                    ffmpeg_cmd,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    errors="replace",
+                    bufsize=1
+                )
+                self.supervisor.watch(self.ffmpeg_process, self._current_segment_path)
+
+                profile_changed = False
+                segment_started = time.monotonic()
+                cpu_started = read_process_cpu_seconds(self.ffmpeg_process.pid)
+                first_segment = True
+
+                # cada linha do csv é "segment_NNNNNN.ts,inicio,fim"
+                for line in self.ffmpeg_process.stdout:
+                    if not line.strip():
+                        continue
+                    segment_id = self.segment_counter
+                    self._add_segment(segment_id)
+                    self.segment_counter += 1
+
+                    now = time.monotonic()
+                    cpu_now = read_process_cpu_seconds(self.ffmpeg_process.pid)
+                    cpu_seconds = cpu_now - cpu_started if cpu_now is not None and cpu_started is not None else None
+                    # o primeiro segmento inclui a abertura da câmera e do encoder
+                    if not first_segment and self._adapt_encoder(segment_id, now - segment_started, cpu_seconds):
+                        # os argumentos do encode só mudam reiniciando o FFmpeg
+                        profile_changed = True
+                        self.ffmpeg_process.terminate()
+                        break
+                    first_segment = False
+                    segment_started, cpu_started = now, cpu_now
+
+                self.ffmpeg_process.wait()
+
+                if self.is_recording and not profile_changed and first_segment and \
+                        self._fall_back_to_encode(f"FFmpeg encerrou com código {self.ffmpeg_process.returncode}"):
+                    continue
+
+                if self.is_recording and not profile_changed:
+                    self._capture_failed(self._exit_message(self.ffmpeg_process.returncode))
+
+            except Exception as e:
+                logger.error(f"erro inesperado na captura contínua: {e}")
+                self._capture_failed(str(e))
+            finally:
+                self.ffmpeg_process = None
+
+    def _current_segment_path(self):
+        """segmento que o FFmpeg está gravando agora"""
+        return self._get_segment_path(self.segment_counter)
+
+    def _exit_message(self, returncode):
+        if self.supervisor.stalled:
+            return f"FFmpeg sem progresso por {self.supervisor.stall_timeout}s"
+        return f"FFmpeg encerrou com código {returncode}"
+
+    def _capture_failed(self, message):
+        """registra a falha, com o fim do stderr do FFmpeg, e espera o backoff antes de reiniciar"""
+        delay = self.supervisor.process_failed(message)
+        stderr = self.supervisor.stderr_tail()
+        logger.error(f"{message}, reiniciando captura em {delay:.0f}s")
+        if stderr:
+            logger.error("stderr do FFmpeg:\n" + "\n".join(stderr))
+        self._emit("buffer.error", {"message": message, "stderr": stderr, "retry_in": delay})
+        self.supervisor.wait_backoff(delay)
+
+    def _read_progress_speed(self, process):
+        """
+        lê o -progress do FFmpeg até o processo terminar e retorna a última
+        velocidade do encode (segundos de vídeo por segundo real), ou None.
+        o FFmpeg mede a velocidade a partir do início da transcodificação, sem
+        contar a abertura da entrada.
+        """
+        speed = None
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            if key != "speed":
+                continue
+            try:
+                speed = float(value.rstrip("x"))
+            except ValueError:
+                # "N/A" antes do primeiro frame
+                continue
+        return speed
+
+    def _record_per_segment(self):
+        """modo antigo: um processo FFmpeg por segmento"""
+        if os.path.isfile(self.video_source) and self.source_duration is None:
+            self.source_duration = self._probe_source_duration()
+
         while self.is_recording:
             segment_path = self._get_segment_path(self.segment_counter)
             
@@ -74,15 +613,17 @@ class CircularVideoBuffer:
             
             ffmpeg_cmd = []
             if is_file:
-                # comando FFmpeg para arquivo de vídeo (loop infinito)
+                # comando FFmpeg para arquivo de vídeo (loop infinito),
+                # continuando de onde o segmento anterior parou
                 ffmpeg_cmd = [
                     "ffmpeg",
+                    "-hide_banner", "-nostats", "-loglevel", "error",
                     "-stream_loop", "-1",  # loop infinito
+                    "-ss", f"{self.source_offset:.3f}",
                     "-i", self.video_source,
-                    "-vcodec", "libx264",
-                    "-preset", "ultrafast",
-                    "-pix_fmt", "yuv420p",
+                    *self._build_video_args(),
                     "-t", str(self.segment_duration),  # duração do segmento
+                    "-progress", "pipe:1",  # velocidade do encode, para o AdaptiveEncoder
                     "-f", "mpegts",
                     "-y",  # sobrescreve arquivo existente
                     segment_path
@@ -91,12 +632,11 @@ class CircularVideoBuffer:
                 # comando FFmpeg para dispositivo de captura
                 ffmpeg_cmd = [
                     "ffmpeg",
-                    "-f", "dshow",
-                    "-i", f"video={self.video_source}",
-                    "-vcodec", "libx264",
-                    "-preset", "ultrafast",
-                    "-pix_fmt", "yuv420p",
+                    "-hide_banner", "-nostats", "-loglevel", "error",
+                    *self._dshow_input_args(),
+                    *self._build_video_args(),
                     "-t", str(self.segment_duration),  # duração do segmento
+                    "-progress", "pipe:1",  # velocidade do encode, para o AdaptiveEncoder
                     "-f", "mpegts",
                     "-y",  # sobrescreve arquivo existente
                     segment_path
@@ -106,60 +646,75 @@ class CircularVideoBuffer:
             
             try:
                 # executa FFmpeg para este segmento
-                process = subprocess.Popen(
+                self._new_process = True
+                process = self.ffmpeg_process = subprocess.Popen(
                     ffmpeg_cmd,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    errors="replace"
                 )
+                self.supervisor.watch(process, lambda: segment_path)
                 
                 # aguarda a conclusão do segmento
+                speed = self._read_progress_speed(process)
                 process.wait()
                 
+                if not self.is_recording:
+                    break
                 if process.returncode == 0 and os.path.exists(segment_path):
                     # adiciona o segmento ao buffer circular
-                    if len(self.segments) >= self.max_segments:
-                        # remove o segmento mais antigo
-                        old_segment = self.segments[0]
-                        old_path = self._get_segment_path(old_segment)
-                        try:
-                            if os.path.exists(old_path):
-                                os.remove(old_path)
-                                logger.debug(f"removido segmento antigo: {old_path}")
-                        except OSError as e:
-                            logger.warning(f"não foi possível remover o segmento antigo {old_path}: {e}")
-                    
-                    self.segments.append(self.segment_counter)
-                    logger.debug(f"segmento {self.segment_counter} adicionado ao buffer")
-                    
+                    self._add_segment(self.segment_counter)
+                    # o próximo processo já usa o perfil novo, se mudar. o tempo do
+                    # processo inteiro inclui abrir a câmera e não serve de medida
+                    if speed:
+                        index = self.ring.get(self.segment_counter)
+                        if index and index["duration"]:
+                            self._adapt_encoder(self.segment_counter, index["duration"] / speed)
                     self.segment_counter += 1
+                    if is_file:
+                        self._advance_source_offset()
+                elif self._fall_back_to_encode(f"FFmpeg retornou código {process.returncode}"):
+                    continue
                 else:
-                    logger.error(f"falha ao gravar segmento {self.segment_counter}. FFmpeg retornou código {process.returncode}")
-                    if process.returncode != 0:
-                        logger.error(f"FFmpeg stderr: {process.stderr.decode()}")
-                    time.sleep(1) # pequeno atraso em caso de falha para evitar loop rápido
+                    logger.error(f"falha ao gravar segmento {self.segment_counter}")
+                    self._capture_failed(self._exit_message(process.returncode))
                     
             except Exception as e:
                 logger.error(f"erro inesperado na gravação de segmento {self.segment_counter}: {e}")
-                time.sleep(1)  # aguarda antes de tentar novamente
+                self._capture_failed(str(e))
+            finally:
+                self.ffmpeg_process = None
     
     def start_recording(self):
         """inicia a gravação contínua do buffer"""
         if self.is_recording:
             logger.warning("buffer já está gravando")
             return True
+        if self.recording_thread and self.recording_thread.is_alive():
+            # a thread de um stop_recording anterior ainda não saiu do loop: uma
+            # nova veria is_recording=True e as duas capturariam ao mesmo tempo
+            logger.error("a captura anterior ainda está encerrando, gravação não iniciada")
+            return False
             
         try:
+            self._prepare_storage()
             self.is_recording = True
+            self._last_segment_at = None
+            self.supervisor.reset()
+            # segmentos re-adotados (ou de antes de um restart) já permitem salvar
+            if len(self.ring):
+                self.ready.set()
+            else:
+                self.ready.clear()
             
-            # inicia a thread de gravação
+            # inicia a thread de gravação; não espera o primeiro segmento
+            # (quem precisar pode usar wait_until_ready)
             self.recording_thread = threading.Thread(target=self._record_segments, daemon=True)
             self.recording_thread.start()
             
             logger.info("gravação do buffer circular iniciada com sucesso")
             
-            # aguarda um pouco para garantir que pelo menos um segmento foi criado
-            time.sleep(self.segment_duration + 1)
-            
             return True
             
         except Exception as e:
@@ -167,13 +722,29 @@ class CircularVideoBuffer:
             self.is_recording = False
             return False
     
+    def wait_until_ready(self, timeout=None):
+        """aguarda o buffer ter pelo menos um segmento; retorna True se ele chegou"""
+        return self.ready.wait(timeout)
+    
     def stop_recording(self):
-        """para a gravação do buffer"""
+        """para a gravação do buffer. retorna False se a thread de captura ainda não encerrou"""
         if not self.is_recording:
-            return
+            return not (self.recording_thread and self.recording_thread.is_alive())
             
         try:
             self.is_recording = False
+            self.ready.clear()
+            # interrompe o watchdog e uma espera de backoff em andamento
+            self.supervisor.cancel()
+
+            # encerra o FFmpeg de longa duração do modo contínuo
+            process = self.ffmpeg_process
+            if process and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
             
             # aguarda a thread terminar
             if self.recording_thread and self.recording_thread.is_alive():
@@ -183,84 +754,241 @@ class CircularVideoBuffer:
             
         except Exception as e:
             logger.error(f"erro ao parar gravação: {e}")
+        return not (self.recording_thread and self.recording_thread.is_alive())
     
-    def save_replay(self, output_path):
-        """salva os últimos N segundos do buffer como replay"""
-        if not self.is_recording:
-            logger.error("buffer não está gravando")
-            return False
+    def _select_window(self, entries, seconds=None, until=None):
+        """
+        escolhe, entre os (id, índice) de um snapshot do anel, os segmentos que cobrem os últimos `seconds` segundos (todos se None),
+        cortando o mais antigo no keyframe mais próximo do início da janela.
+        
+        com `until` (horário unix) a janela termina nesse instante em vez de no
+        último segmento, o que permite salvar várias câmeras no mesmo momento.
+        
+        retorna (lista de (fonte, offset inicial, offset final), cabeçalho PAT/PMT
+        a prefixar, início e fim reais da janela cortada em horário unix, True se
+        a janela junta mais de um processo FFmpeg)
+        """
+        selected = []
+        header = b""
+        total = 0.0
+        window_end = None
+        generations = set()
+        
+        for segment_id, index in reversed(entries):
+            segment_path = self._get_segment_path(segment_id)
+            source = self.storage.source(segment_id, segment_path)
+            if source is None or not self.storage.exists(segment_id, segment_path):
+                continue
+            
+            duration = self._segment_duration(index)
+            start, end = 0, None
+            generations.add(index["generation"] if index else None)
+            end_pts = index["end_pts"] if index else None
+            
+            if until is not None and index:
+                wall_start = index["completed_at"] - duration
+                if wall_start >= until:
+                    # segmento inteiro depois do momento pedido
+                    continue
+                if index["completed_at"] > until:
+                    # corta o fim no keyframe mais próximo do momento pedido
+                    target_pts = index["start_pts"] + (until - wall_start) * TS_CLOCK
+                    later = [kf for kf in index["keyframes"] if kf[1] > 0]
+                    if later:
+                        end_pts, end, _ = min(later, key=lambda kf: abs(kf[0] - target_pts))
+                        duration = (end_pts - index["start_pts"]) / TS_CLOCK
             
-        if len(self.segments) == 0:
-            logger.error("nenhum segmento disponível no buffer")
+            if window_end is None:
+                # fim do segmento mais novo da janela (sem índice não há horário: usa o momento pedido)
+                if index:
+                    window_end = index["completed_at"] - self._segment_duration(index) + duration
+                else:
+                    window_end = until if until is not None else time.time()
+            
+            if seconds and total + duration >= seconds:
+                if index:
+                    target_pts = end_pts - (seconds - total) * TS_CLOCK
+                    earlier = [kf for kf in index["keyframes"] if end is None or kf[1] < end]
+                    if earlier:
+                        pts, start, with_psi = min(earlier, key=lambda kf: abs(kf[0] - target_pts))
+                        duration = (end_pts - pts) / TS_CLOCK
+                        if start and not with_psi:
+                            header = index["psi"]
+                selected.append((source, start, end))
+                total += duration
+                break
+            
+            selected.append((source, start, end))
+            total += duration
+        
+        selected.reverse()
+        if window_end is None:
+            return selected, header, None, None, len(generations) > 1
+        return selected, header, window_end - total, window_end, len(generations) > 1
+    
+    def _remux_to_mp4(self, segments, output_path, fix_up, header=b""):
+        """
+        envia os segmentos concatenados ao FFmpeg pelo stdin e remuxa para MP4
+        sem reencode, com o moov no início (ou fragmentado) para o player não
+        precisar baixar o arquivo inteiro antes do primeiro frame
+        """
+        ffmpeg_cmd = [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel", "error",
+            "-f", "mpegts",
+            "-i", "pipe:0",
+            "-c", "copy",
+            *mp4_output_args(self.mp4_mode),
+            "-y",
+            output_path
+        ]
+        
+        logger.debug(f"comando FFmpeg: {' '.join(ffmpeg_cmd)}")
+        
+        process = subprocess.Popen(
+            ffmpeg_cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        
+        try:
+            write_concatenated(segments, process.stdin, fix_up=fix_up, header=header)
+        except BrokenPipeError:
+            # o FFmpeg encerrou antes de ler tudo; o erro aparece no stderr
+            pass
+        
+        try:
+            _, stderr = process.communicate(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            logger.error("tempo esgotado ao remuxar replay para MP4")
             return False
         
+        if process.returncode != 0:
+            logger.error(f"erro ao salvar replay: {stderr.decode(errors='replace')}")
+            return False
+        return True
+    
+    def save_replay(self, output_path, seconds=None, until=None):
+        """
+        salva os últimos `seconds` segundos do buffer como replay (o buffer inteiro se None).
+        com `until` (horário unix) a janela termina nesse instante.
+        o corte é feito no keyframe mais próximo, sem reencode.
+        saídas .ts são concatenadas em processo; .mp4 usa o FFmpeg para remuxar.
+        
+        retorna (início, fim) da janela realmente salva, em horário unix, ou None se falhar.
+        """
+        start = time.perf_counter()
+        saved = self._save_replay(output_path, seconds, until)
+        if saved is not None:
+            output_format = os.path.splitext(output_path)[1].lstrip(".").lower()
+            REPLAY_SAVE_SECONDS.observe(time.perf_counter() - start, buffer=self.name, format=output_format)
+        REPLAY_SAVES_TOTAL.inc(buffer=self.name, result="saved" if saved is not None else "error")
+        return saved
+
+    def _save_replay(self, output_path, seconds, until):
+        if not self.is_recording:
+            logger.error("buffer não está gravando")
+            return None
+            
+        # os segmentos do snapshot ficam reservados até o fim da concatenação,
+        # enquanto a captura continua adicionando e descartando segmentos
+        with self.ring.lease() as snapshot:
+            if len(snapshot) == 0:
+                logger.error("nenhum segmento disponível no buffer")
+                return None
+            return self._save_snapshot(snapshot.entries, output_path, seconds, until)
+
+    def _save_snapshot(self, entries, output_path, seconds, until):
         try:
-            # cria lista de arquivos de entrada para concatenação
-            segment_files = []
-            for segment_id in self.segments:
-                segment_path = self._get_segment_path(segment_id)
-                if os.path.exists(segment_path):
-                    segment_files.append(segment_path)
+            # seleciona os segmentos da janela pedida
+            segments, header, start, end, multiple_processes = self._select_window(entries, seconds, until)
             
-            if not segment_files:
+            if not segments:
                 logger.error("nenhum arquivo de segmento encontrado")
-                return False
-            
-            # cria arquivo temporário com lista de segmentos
-            concat_file = os.path.join(self.output_dir, "concat_list.txt")
-            with open(concat_file, 'w') as f:
-                for segment_file in segment_files:
-                    f.write(f"file '{segment_file}'\n")
-            
-            # comando FFmpeg para concatenar segmentos
-            ffmpeg_cmd = [
-                "ffmpeg",
-                "-f", "concat",
-                "-safe", "0",
-                "-i", concat_file,
-                "-c", "copy",
-                "-y",
-                output_path
-            ]
+                return None
             
-            logger.info(f"salvando replay: {output_path}")
-            logger.debug(f"comando FFmpeg: {' '.join(ffmpeg_cmd)}")
+            # segmentos do mesmo processo FFmpeg já são contínuos; no modo por
+            # segmento cada processo recomeça counters e timestamps
+            fix_up = self.capture_mode == "per_segment" or multiple_processes
             
-            # executa a concatenação
-            result = subprocess.run(
-                ffmpeg_cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            logger.info(f"salvando replay: {output_path} ({end - start:.1f}s)")
             
-            # remove arquivo temporário
-            if os.path.exists(concat_file):
-                os.remove(concat_file)
+            if output_path.lower().endswith(".ts"):
+                # concatenação em processo, sem FFmpeg
+                concat_segments(segments, output_path, fix_up=fix_up, header=header)
+            elif not self._remux_to_mp4(segments, output_path, fix_up, header):
+                return None
             
-            if result.returncode == 0 and os.path.exists(output_path):
+            if os.path.exists(output_path):
                 logger.info(f"replay salvo com sucesso: {output_path}")
-                return True
+                return start, end
             else:
-                logger.error(f"erro ao salvar replay: {result.stderr}")
-                return False
+                logger.error(f"arquivo de replay não foi criado: {output_path}")
+                return None
                 
         except Exception as e:
             logger.error(f"erro ao salvar replay: {e}")
-            return False
+            return None
     
     def get_buffer_info(self):
         """retorna informações sobre o estado atual do buffer"""
         return {
             "is_recording": self.is_recording,
-            "segments_count": len(self.segments),
+            "ready": self.ready.is_set(),
+            "segments_count": len(self.ring),
             "max_segments": self.max_segments,
             "buffer_duration": self.buffer_duration,
             "segment_duration": self.segment_duration,
-            "total_duration": len(self.segments) * self.segment_duration
+            "capture_mode": self.capture_mode,
+            "mp4_mode": self.mp4_mode,
+            "storage": self.storage.get_info(),
+            "ring": self.ring.get_info(),
+            "recovered_segments": self.recovered_segments,
+            "supervisor": self.supervisor.get_info(),
+            "source_offset": self.source_offset if self.capture_mode == "per_segment" else None,
+            "total_duration": self.get_available_duration(),
+            "video_codec": {
+                "mode": self.video_codec_mode,
+                "source_codec": self.source_codec
+            },
+            "adaptive_encoding": self.adaptive_encoding,
+            "encoder": self.encoder.get_info()
         }
     
+    def get_live_segments(self):
+        """
+        retorna uma cópia da lista de segmentos do buffer como (id, duração,
+        sequência de descontinuidade), do mais antigo ao mais novo. a sequência
+        cresce a cada troca de processo FFmpeg e nunca volta.
+        """
+        return [
+            (segment_id, self._segment_duration(index), discontinuity)
+            for segment_id, index, discontinuity in self.ring.timeline()
+        ]
+
+    def acquire_segment(self, segment_id):
+        """
+        reserva um segmento que ainda está no buffer e retorna (fonte, lease): o
+        caminho do arquivo (disco) ou um memoryview (memória) e o SegmentLease
+        que precisa ser liberado ao fim da leitura. retorna (None, None) se o
+        segmento já saiu do buffer.
+        """
+        lease = self.ring.lease([segment_id])
+        segment_path = self._get_segment_path(segment_id)
+        if not lease.entries or not self.storage.exists(segment_id, segment_path):
+            lease.release()
+            return None, None
+        return self.storage.source(segment_id, segment_path), lease
+
     def get_available_duration(self):
         """retorna a duração disponível no buffer em segundos"""
-        return len(self.segments) * self.segment_duration
+        return sum(self._segment_duration(index) for _, index in self.ring.snapshot())
+
+    def _segment_duration(self, index):
+        """duração real do segmento segundo o índice (ou a nominal, se não indexado)"""
+        return index["duration"] if index else self.segment_duration
 
@@ -0,0 +1,149 @@
+import os
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# perfis de encode do mais caro (melhor qualidade por bit) ao mais barato.
+# height/fps None mantêm a resolução e o framerate da câmera
+DEFAULT_ENCODER_PROFILES = [
+    {"name": "high", "preset": "veryfast", "height": None, "fps": None},
+    {"name": "medium", "preset": "superfast", "height": None, "fps": None},
+    {"name": "fast", "preset": "ultrafast", "height": None, "fps": None},
+    {"name": "reduced", "preset": "ultrafast", "height": 720, "fps": 30},
+    {"name": "minimal", "preset": "ultrafast", "height": 480, "fps": 20}
+]
+
+# perfil inicial: o mesmo encode usado antes da adaptação (ultrafast sem redução)
+DEFAULT_INITIAL_PROFILE = "fast"
+
+
+def read_process_cpu_seconds(pid):
+    """tempo de CPU (usuário + sistema) de um processo, via /proc; None se indisponível"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # os campos depois do nome (que pode ter espaços) começam após o ")"
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class AdaptiveEncoder:
+    """
+    escolhe o perfil de encode a partir do desempenho medido em cada segmento.
+
+    se o encode não acompanha o tempo real (o segmento demora mais que o vídeo
+    que ele contém) ou a CPU está quase toda ocupada, passa para um perfil mais
+    barato. com folga de CPU por vários segmentos, volta para um perfil melhor.
+    depois de cada troca espera alguns segmentos antes de decidir de novo.
+    """
+
+    def __init__(self, profiles=None, initial_profile=DEFAULT_INITIAL_PROFILE, min_profile=None, max_profile=None,
+                 window=3, cooldown=3, stable_segments=20):
+        """
+        Args:
+            profiles: lista de perfis, do mais caro ao mais barato
+            initial_profile: nome do perfil inicial
+            min_profile / max_profile: nomes do perfil mais barato e do mais caro permitidos
+            window: segmentos considerados em cada decisão
+            cooldown: segmentos ignorados depois de uma troca
+            stable_segments: sem medição de CPU (ex.: Windows), segmentos em dia
+                necessários para tentar um perfil melhor
+        """
+        self.profiles = profiles or DEFAULT_ENCODER_PROFILES
+        names = [profile["name"] for profile in self.profiles]
+        for name in (initial_profile, min_profile, max_profile):
+            if name is not None and name not in names:
+                raise ValueError(f"perfil de encode desconhecido: {name}")
+
+        self._best = names.index(max_profile) if max_profile else 0
+        self._cheapest = names.index(min_profile) if min_profile else len(names) - 1
+        initial = names.index(initial_profile) if initial_profile in names else self._best
+        self.current = min(max(initial, self._best), self._cheapest)
+
+        self.window = window
+        self.cooldown = cooldown
+        self.stable_segments = stable_segments
+        self.cpu_count = os.cpu_count() or 1
+
+        self._samples = deque(maxlen=window)
+        self._skip = 0
+        self._on_time_streak = 0
+        self.changes = 0
+        self.last_reason = None
+
+    @property
+    def profile(self):
+        return self.profiles[self.current]
+
+    def ffmpeg_args(self):
+        """argumentos de saída do FFmpeg para o perfil atual"""
+        profile = self.profile
+        args = ["-vcodec", "libx264", "-preset", profile["preset"]]
+        filters = []
+        if profile.get("fps"):
+            filters.append(f"fps={profile['fps']}")
+        if profile.get("height"):
+            # nunca aumenta a resolução da câmera
+            filters.append(f"scale=-2:'min({profile['height']},ih)'")
+        if filters:
+            args += ["-vf", ",".join(filters)]
+        return args
+
+    def observe(self, media_seconds, wall_seconds, cpu_seconds=None):
+        """
+        registra um segmento: duração do vídeo, tempo real gasto e, se
+        disponível, CPU gasta pelo FFmpeg no período. retorna True se o
+        perfil mudou (o FFmpeg precisa ser reiniciado com os novos argumentos).
+        """
+        if not media_seconds or wall_seconds <= 0:
+            return False
+        if self._skip > 0:
+            self._skip -= 1
+            return False
+
+        realtime_factor = wall_seconds / media_seconds
+        cpu_load = cpu_seconds / (wall_seconds * self.cpu_count) if cpu_seconds is not None else None
+        self._samples.append((realtime_factor, cpu_load))
+        if len(self._samples) < self.window:
+            return False
+
+        mean_factor = sum(factor for factor, _ in self._samples) / len(self._samples)
+        loads = [load for _, load in self._samples if load is not None]
+        mean_load = sum(loads) / len(loads) if loads else None
+
+        if mean_factor > 1.05 or (mean_load is not None and mean_load > 0.9):
+            self._on_time_streak = 0
+            return self._step(+1, f"atrasado (fator {mean_factor:.2f}, cpu {self._format_load(mean_load)})")
+
+        self._on_time_streak += 1
+        has_headroom = mean_load < 0.5 if mean_load is not None else self._on_time_streak >= self.stable_segments
+        if mean_factor <= 1.02 and has_headroom:
+            self._on_time_streak = 0
+            return self._step(-1, f"com folga (fator {mean_factor:.2f}, cpu {self._format_load(mean_load)})")
+        return False
+
+    def _format_load(self, load):
+        return f"{load:.0%}" if load is not None else "n/d"
+
+    def _step(self, direction, reason):
+        target = min(max(self.current + direction, self._best), self._cheapest)
+        if target == self.current:
+            return False
+        previous = self.profile["name"]
+        self.current = target
+        self.changes += 1
+        self.last_reason = reason
+        self._samples.clear()
+        self._skip = self.cooldown
+        logger.info(f"perfil de encode: {previous} -> {self.profile['name']} ({reason})")
+        return True
+
+    def get_info(self):
+        return {
+            "profile": dict(self.profile),
+            "allowed": [profile["name"] for profile in self.profiles[self._best:self._cheapest + 1]],
+            "changes": self.changes,
+            "last_reason": self.last_reason
+        }
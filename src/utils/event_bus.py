@@ -0,0 +1,120 @@
+import json
+import threading
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class _Subscription:
+    """
+    iterador de um cliente que devolve a vaga no close(). o servidor WSGI chama
+    close() mesmo se o cliente desconectar antes do primeiro bloco, quando o
+    finally de um gerador que nunca rodou não seria executado.
+    """
+
+    def __init__(self, bus, frames):
+        self._bus = bus
+        self._frames = frames
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._frames)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._frames.close()
+        self._bus._release()
+
+
+class EventBus:
+    """
+    canal de eventos para Server-Sent Events com um produtor e vários clientes.
+    cada evento é serializado uma única vez no formato SSE e guardado em um
+    histórico curto; os clientes só esperam na mesma Condition e copiam os
+    bytes prontos, então N abas abertas não custam N consultas ao banco.
+    o histórico também permite retomar a conexão pelo Last-Event-ID.
+
+    eventos e histórico ficam na memória do processo: a aplicação roda com um
+    único worker, e é nele que os produtores (jobs, buffers) publicam.
+    """
+
+    def __init__(self, history=256, max_subscribers=100, heartbeat=15):
+        """
+        Args:
+            history: número de eventos recentes mantidos para reconexões
+            max_subscribers: limite de clientes conectados ao mesmo tempo
+            heartbeat: intervalo em segundos dos comentários que mantêm a conexão aberta
+        """
+        self.max_subscribers = max_subscribers
+        self.heartbeat = heartbeat
+
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)  # (id, bytes no formato SSE)
+        self._last_id = 0
+        self._subscribers = 0
+        self._closed = False
+
+    def publish(self, event, data):
+        """publica um evento (data precisa ser serializável em JSON)"""
+        with self._condition:
+            self._last_id += 1
+            payload = json.dumps(data, separators=(",", ":"), default=str)
+            frame = f"id: {self._last_id}\nevent: {event}\ndata: {payload}\n\n".encode()
+            self._events.append((self._last_id, frame))
+            self._condition.notify_all()
+
+    def subscribe(self, last_event_id=None):
+        """
+        retorna um iterador de bytes SSE para um cliente (a vaga é liberada no
+        close()), ou None se o limite de clientes foi atingido. com
+        last_event_id, reenvia os eventos perdidos que ainda estiverem no histórico.
+        """
+        # verifica o limite e reserva a vaga no mesmo lock: dois clientes
+        # chegando juntos não podem passar os dois pela última vaga
+        with self._condition:
+            if self._subscribers >= self.max_subscribers:
+                return None
+            self._subscribers += 1
+            cursor = self._last_id if last_event_id is None else last_event_id
+        return _Subscription(self, self._stream(cursor))
+
+    def _release(self):
+        with self._condition:
+            self._subscribers -= 1
+
+    def _stream(self, cursor):
+        # o navegador espera 3s antes de reconectar
+        yield b"retry: 3000\n\n"
+        while True:
+            with self._condition:
+                if self._last_id <= cursor and not self._closed:
+                    self._condition.wait(self.heartbeat)
+                if self._closed:
+                    return
+                frames = [frame for event_id, frame in self._events if event_id > cursor]
+                cursor = self._last_id
+
+            if frames:
+                yield b"".join(frames)
+            else:
+                yield b": heartbeat\n\n"
+
+    def close(self):
+        """encerra todas as conexões abertas"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def get_info(self):
+        with self._condition:
+            return {
+                "subscribers": self._subscribers,
+                "last_event_id": self._last_id,
+                "history": len(self._events)
+            }
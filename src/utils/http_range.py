@@ -0,0 +1,134 @@
+import io
+import os
+import logging
+import unicodedata
+from urllib.parse import quote
+from datetime import datetime, timezone
+from flask import request, current_app, Response
+from werkzeug.http import is_resource_modified, dump_options_header
+from werkzeug.wsgi import wrap_file
+
+logger = logging.getLogger(__name__)
+
+# tamanho dos blocos lidos quando o range termina antes do fim do arquivo
+RANGE_CHUNK_SIZE = 256 * 1024
+
+
+class _ObservedFile(io.FileIO):
+    """
+    arquivo que chama on_close(bytes enviados) ao ser fechado (fim do envio ou
+    cliente desconectado). os bytes vêm da posição do arquivo: ela avança tanto
+    nas leituras em blocos quanto no sendfile do servidor (socket.sendfile
+    atualiza a posição), então um download interrompido conta só o que saiu
+    """
+
+    on_close = None
+    start = 0
+
+    def close(self):
+        callback, self.on_close = self.on_close, None
+        sent_bytes = 0 if self.closed else self.tell() - self.start
+        super().close()
+        if callback is not None:
+            callback(sent_bytes)
+
+
+def _iter_range(f, length):
+    """lê `length` bytes do arquivo a partir da posição atual, em blocos"""
+    try:
+        while length > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _content_disposition(filename):
+    """Content-Disposition de download com o nome escapado (filename* do RFC 5987 se não for ASCII)"""
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii")
+        # safe = attr-char do RFC 5987
+        quoted = quote(filename, safe="!#$&+-.^_`|~")
+        return dump_options_header("attachment", {"filename": simple, "filename*": f"UTF-8''{quoted}"})
+    return dump_options_header("attachment", {"filename": filename})
+
+
+def _if_range_matches(etag, last_modified):
+    """verifica o If-Range: o range só vale se o arquivo não mudou"""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return last_modified <= if_range.date
+    return True
+
+
+def send_video(file_path, mimetype, as_attachment=False, download_name=None, max_age=3600, on_close=None):
+    """
+    envia um arquivo de vídeo com suporte a Range (206), ETag/Last-Modified e 304.
+
+    o corpo é enviado com wsgi.file_wrapper sempre que o trecho vai até o fim do
+    arquivo (o caso de play e seek em players HTML5), o que permite ao servidor
+    (ex.: gunicorn) usar sendfile sem copiar os bytes pelo python. com
+    USE_X_SENDFILE o envio fica todo a cargo do servidor web.
+    on_close(bytes) é chamada quando o corpo termina de ser enviado (ou o
+    cliente desconecta), com os bytes que de fato saíram.
+    """
+    stat = os.stat(file_path)
+    size = stat.st_size
+    mtime = stat.st_mtime
+    last_modified = datetime.fromtimestamp(int(mtime), timezone.utc)
+    etag = f"{stat.st_mtime_ns:x}-{size:x}"
+
+    headers = {"Accept-Ranges": "bytes"}
+    if as_attachment:
+        filename = download_name or os.path.basename(file_path)
+        headers["Content-Disposition"] = _content_disposition(filename)
+
+    def finish(response):
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        return response
+
+    # requisição condicional: o cliente já tem esta versão
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return finish(Response(status=304, headers=headers))
+
+    start, stop = 0, size
+    status = 200
+    # vários ranges no mesmo request (multipart/byteranges) não são suportados:
+    # o RFC 9110 permite ignorar o Range e responder 200 com o arquivo inteiro
+    if (request.range is not None and len(request.range.ranges) == 1
+            and _if_range_matches(etag, last_modified)):
+        byte_range = request.range.range_for_length(size)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return finish(Response(status=416, headers=headers))
+        start, stop = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+    if status == 200 and current_app.config.get('USE_X_SENDFILE'):
+        headers["X-Sendfile"] = os.path.abspath(file_path)
+        response = Response(status=200, headers=headers, mimetype=mimetype)
+        response.content_length = size
+        return finish(response)
+
+    f = _ObservedFile(file_path, "rb")
+    f.on_close = on_close
+    f.start = f.seek(start)
+    if stop == size:
+        body = wrap_file(request.environ, f)
+    else:
+        body = _iter_range(f, stop - start)
+
+    response = Response(body, status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
+    response.content_length = stop - start
+    return finish(response)
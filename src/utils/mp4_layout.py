@@ -0,0 +1,205 @@
+import os
+import time
+import struct
+import threading
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+# movflags de cada modo de MP4:
+# faststart: moov no início do arquivo (o FFmpeg reescreve o arquivo no fim do remux)
+# fragmented: moov vazio no início e fragmentos moof/mdat a cada keyframe
+MP4_MOVFLAGS = {
+    "faststart": "+faststart",
+    "fragmented": "+frag_keyframe+empty_moov+default_base_moof"
+}
+
+
+def mp4_output_args(mode):
+    """argumentos de saída do FFmpeg para gravar um MP4 que toca antes de baixar inteiro"""
+    if mode not in MP4_MOVFLAGS:
+        raise ValueError(f"modo de MP4 inválido: {mode}")
+    return ["-movflags", MP4_MOVFLAGS[mode], "-f", "mp4"]
+
+
+def read_top_level_boxes(path, limit=32):
+    """retorna [(tipo, offset, tamanho)] das caixas de nível superior de um MP4"""
+    boxes = []
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        offset = 0
+        while offset + 8 <= file_size and len(boxes) < limit:
+            f.seek(offset)
+            size, box_type = struct.unpack(">I4s", f.read(8))
+            if size == 1:
+                # tamanho de 64 bits logo depois do tipo
+                size = struct.unpack(">Q", f.read(8))[0]
+            elif size == 0:
+                # a caixa vai até o fim do arquivo
+                size = file_size - offset
+            if size < 8:
+                break
+            boxes.append((box_type.decode("latin-1"), offset, size))
+            offset += size
+    return boxes
+
+
+def is_web_optimized(path):
+    """
+    True se o moov vem antes dos dados (faststart ou fragmentado), False se
+    vem depois e None se o arquivo não for um MP4 completo (ex.: ainda sendo gravado).
+    """
+    try:
+        types = [box_type for box_type, _, _ in read_top_level_boxes(path)]
+    except (OSError, struct.error):
+        return None
+    if "moov" not in types:
+        return None
+    if "mdat" not in types:
+        return True
+    return types.index("moov") < types.index("mdat")
+
+
+def optimize_mp4(path, mode="faststart", timeout=300):
+    """
+    regrava um MP4 sem reencode com o moov no início (ou fragmentado). o
+    arquivo novo substitui o antigo de forma atômica, então quem está lendo
+    continua com o arquivo antigo até fechar. retorna True se regravou.
+    """
+    tmp_path = f"{path}.tmp"
+    ffmpeg_cmd = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        "-i", path,
+        "-map", "0",
+        "-c", "copy",
+        *mp4_output_args(mode),
+        "-y",
+        tmp_path
+    ]
+    try:
+        result = subprocess.run(ffmpeg_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+        if result.returncode != 0:
+            logger.error(f"erro ao otimizar {path}: {result.stderr.decode(errors='replace')}")
+            return False
+        os.replace(tmp_path, path)
+        return True
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.error(f"erro ao otimizar {path}: {e}")
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+class Mp4LayoutUpgrader:
+    """
+    job em segundo plano que percorre o diretório de replays uma vez e regrava,
+    um por vez, os MP4 antigos com o moov no fim. arquivos modificados há
+    pouco tempo são ignorados, porque podem estar sendo gravados.
+    """
+
+    def __init__(self, directory, mode="faststart", min_age=120, pause=0.5, on_upgraded=None):
+        """
+        Args:
+            directory: diretório dos replays
+            mode: "faststart" ou "fragmented"
+            min_age: idade mínima em segundos de um arquivo para ser regravado
+            pause: espera em segundos entre dois arquivos, para não disputar disco com a captura
+            on_upgraded: função (nome do arquivo, tamanho antigo, tamanho novo) chamada a cada arquivo regravado
+        """
+        if mode not in MP4_MOVFLAGS:
+            raise ValueError(f"modo de MP4 inválido: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.min_age = min_age
+        self.pause = pause
+        self.on_upgraded = on_upgraded
+
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._state = {
+            "running": False,
+            "started_at": None,
+            "finished_at": None,
+            "scanned": 0,
+            "upgraded": 0,
+            "skipped": 0,
+            "failed": 0
+        }
+
+    def start(self):
+        """inicia uma passada em segundo plano (nada acontece se já houver uma rodando)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self.run_once, name="mp4-layout-upgrade", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def run_once(self):
+        """percorre o diretório e regrava os MP4 que ainda não tocam de forma progressiva"""
+        with self._lock:
+            self._state.update(running=True, started_at=time.time(), finished_at=None,
+                               scanned=0, upgraded=0, skipped=0, failed=0)
+        try:
+            with os.scandir(self.directory) as entries:
+                candidates = [entry.path for entry in entries if entry.is_file() and entry.name.lower().endswith(".mp4")]
+        except OSError as e:
+            logger.error(f"erro ao listar {self.directory}: {e}")
+            candidates = []
+
+        for path in candidates:
+            if self._stop_event.is_set():
+                break
+            outcome = self._upgrade(path)
+            with self._lock:
+                self._state["scanned"] += 1
+                self._state[outcome] += 1
+            if outcome == "upgraded":
+                self._stop_event.wait(self.pause)
+
+        with self._lock:
+            self._state.update(running=False, finished_at=time.time())
+            upgraded = self._state["upgraded"]
+        if upgraded:
+            logger.info(f"{upgraded} replays regravados com MP4 {self.mode}")
+
+    def _upgrade(self, path):
+        try:
+            old_size = os.path.getsize(path)
+            if time.time() - os.path.getmtime(path) < self.min_age:
+                return "skipped"
+        except OSError:
+            return "skipped"
+
+        optimized = is_web_optimized(path)
+        if optimized is not False:
+            # já otimizado, ou incompleto/ilegível: não mexe
+            return "skipped"
+        if not optimize_mp4(path, self.mode):
+            return "failed"
+
+        new_size = os.path.getsize(path)
+        if self.on_upgraded is not None:
+            try:
+                self.on_upgraded(os.path.basename(path), old_size, new_size)
+            except Exception as e:
+                logger.error(f"erro ao registrar o replay regravado {path}: {e}")
+        return "upgraded"
+
+    def get_info(self):
+        with self._lock:
+            return dict(self._state, mode=self.mode)
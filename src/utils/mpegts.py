@@ -0,0 +1,383 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+TS_PACKET_SIZE = 188
+SYNC_BYTE = 0x47
+NULL_PID = 0x1FFF
+PAT_PID = 0x0000
+SDT_PID = 0x0011
+
+# timestamps do MPEG-TS têm 33 bits no relógio de 90 kHz
+TS_CLOCK = 90000
+TS_MAX = 1 << 33
+
+# tamanho dos blocos quando a cópia zero-copy não está disponível
+COPY_CHUNK_SIZE = 1 << 20
+
+# quanto do início do primeiro segmento é lido para alinhar os counters do header
+HEADER_SCAN_SIZE = 1 << 20
+
+
+def _read_timestamp(data, pos):
+    """lê um PTS/DTS de 33 bits codificado em 5 bytes"""
+    return (((data[pos] >> 1) & 0x07) << 30) | (data[pos + 1] << 22) | \
+           ((data[pos + 2] >> 1) << 15) | (data[pos + 3] << 7) | (data[pos + 4] >> 1)
+
+
+def _write_timestamp(data, pos, value):
+    """grava um PTS/DTS de 33 bits preservando o prefixo de 4 bits e os marker bits"""
+    value %= TS_MAX
+    data[pos] = (data[pos] & 0xF0) | (((value >> 30) & 0x07) << 1) | 1
+    data[pos + 1] = (value >> 22) & 0xFF
+    data[pos + 2] = (((value >> 15) & 0x7F) << 1) | 1
+    data[pos + 3] = (value >> 7) & 0xFF
+    data[pos + 4] = ((value & 0x7F) << 1) | 1
+
+
+def _read_pcr_base(data, pos):
+    """lê a base de 33 bits do PCR"""
+    return (data[pos] << 25) | (data[pos + 1] << 17) | (data[pos + 2] << 9) | \
+           (data[pos + 3] << 1) | (data[pos + 4] >> 7)
+
+
+def _write_pcr_base(data, pos, value):
+    """grava a base de 33 bits do PCR preservando a extensão"""
+    value %= TS_MAX
+    data[pos] = (value >> 25) & 0xFF
+    data[pos + 1] = (value >> 17) & 0xFF
+    data[pos + 2] = (value >> 9) & 0xFF
+    data[pos + 3] = (value >> 1) & 0xFF
+    data[pos + 4] = ((value & 0x01) << 7) | (data[pos + 4] & 0x7F)
+
+
+def _iter_packets(data):
+    """
+    percorre os pacotes TS de um buffer.
+    gera (posição, pid, pusi, afc, início do payload) para cada pacote válido.
+    """
+    end = len(data) - len(data) % TS_PACKET_SIZE
+    for pos in range(0, end, TS_PACKET_SIZE):
+        if data[pos] != SYNC_BYTE:
+            continue
+        b1 = data[pos + 1]
+        pid = ((b1 & 0x1F) << 8) | data[pos + 2]
+        afc = (data[pos + 3] >> 4) & 0x03
+        payload = pos + 4
+        if afc & 0x02:
+            payload += 1 + data[pos + 4]
+        yield pos, pid, bool(b1 & 0x40), afc, payload
+
+
+def _pes_timestamp_positions(data, payload, packet_end):
+    """retorna as posições do PTS e do DTS (ou None) de um cabeçalho PES"""
+    if payload + 14 > packet_end or data[payload:payload + 3] != b"\x00\x00\x01":
+        return None, None
+    stream_id = data[payload + 3]
+    # streams sem cabeçalho PES estendido (padding, private_stream_2, etc.)
+    if stream_id in (0xBC, 0xBE, 0xBF, 0xF0, 0xF1, 0xF2, 0xF8, 0xFF):
+        return None, None
+    flags = data[payload + 7] >> 6
+    pts_pos = payload + 9 if flags & 0x02 else None
+    dts_pos = payload + 14 if flags == 0x03 and payload + 19 <= packet_end else None
+    return pts_pos, dts_pos
+
+
+def video_pts_bounds(data):
+    """
+    retorna (primeiro PTS, último PTS, duração média de frame) do vídeo de um segmento.
+    retorna (None, None, None) se não houver vídeo com timestamps.
+    """
+    first = last = None
+    previous = None
+    deltas = []
+    for pos, pid, pusi, afc, payload in _iter_packets(data):
+        if not pusi or not afc & 0x01:
+            continue
+        stream_id = data[payload + 3] if payload + 4 <= pos + TS_PACKET_SIZE else None
+        if stream_id is None or not 0xE0 <= stream_id <= 0xEF:
+            continue
+        pts_pos, _ = _pes_timestamp_positions(data, payload, pos + TS_PACKET_SIZE)
+        if pts_pos is None:
+            continue
+        pts = _read_timestamp(data, pts_pos)
+        if first is None:
+            first = pts
+        if previous is not None and pts > previous:
+            deltas.append(pts - previous)
+        previous = pts
+        last = pts if last is None else max(last, pts)
+
+    if first is None:
+        return None, None, None
+    frame_duration = sorted(deltas)[len(deltas) // 2] if deltas else TS_CLOCK // 30
+    return first, last, frame_duration
+
+
+def _parse_pat(data, payload, packet_end):
+    """retorna os PIDs das PMTs listadas em um pacote de PAT"""
+    section = payload + 1 + data[payload]  # pula o pointer field
+    if section + 8 > packet_end or data[section] != 0x00:
+        return set()
+    section_length = ((data[section + 1] & 0x0F) << 8) | data[section + 2]
+    end = min(section + 3 + section_length - 4, packet_end)  # sem o CRC
+    pids = set()
+    for entry in range(section + 8, end - 3, 4):
+        program_number = (data[entry] << 8) | data[entry + 1]
+        if program_number != 0:
+            pids.add(((data[entry + 2] & 0x1F) << 8) | data[entry + 3])
+    return pids
+
+
+def index_segment(data):
+    """
+    indexa um segmento MPEG-TS: PTS inicial e final do vídeo, duração e a
+    posição em bytes de cada keyframe.
+
+    retorna um dicionário com:
+        start_pts / end_pts: PTS do primeiro frame e do fim do último frame
+        duration: duração em segundos
+        keyframes: lista de (pts, offset, with_psi); with_psi indica que a
+            PAT/PMT vem logo antes do keyframe e o offset aponta para ela,
+            então cortar ali gera um stream decodificável por si só
+        psi: pacotes da primeira PAT/PMT do segmento, para prefixar cortes
+            em keyframes sem PAT/PMT
+    retorna None se o segmento não tiver vídeo com timestamps.
+    """
+    psi_pids = {PAT_PID, SDT_PID}
+    pmt_pids = set()
+    pat_packet = pmt_packet = None
+    psi_run_start = None
+
+    start = last = None
+    previous = None
+    deltas = []
+    keyframes = []
+
+    for pos, pid, pusi, afc, payload in _iter_packets(data):
+        packet_end = pos + TS_PACKET_SIZE
+
+        if pid in psi_pids or pid in pmt_pids:
+            if psi_run_start is None:
+                psi_run_start = pos
+            if pid == PAT_PID and pusi:
+                pmt_pids |= _parse_pat(data, payload, packet_end)
+                if pat_packet is None:
+                    pat_packet = bytes(data[pos:packet_end])
+            elif pid in pmt_pids and pmt_packet is None:
+                pmt_packet = bytes(data[pos:packet_end])
+            continue
+
+        run_start, psi_run_start = psi_run_start, None
+
+        if not pusi or not afc & 0x01 or payload + 4 > packet_end:
+            continue
+        if not 0xE0 <= data[payload + 3] <= 0xEF:
+            continue
+        pts_pos, _ = _pes_timestamp_positions(data, payload, packet_end)
+        if pts_pos is None:
+            continue
+
+        pts = _read_timestamp(data, pts_pos)
+        if previous is not None and pts > previous:
+            deltas.append(pts - previous)
+        previous = pts
+        start = pts if start is None else min(start, pts)
+        last = pts if last is None else max(last, pts)
+
+        # random_access_indicator no adaptation field marca os keyframes
+        if afc & 0x02 and data[pos + 4] >= 1 and data[pos + 5] & 0x40:
+            if run_start is not None:
+                keyframes.append((pts, run_start, True))
+            else:
+                keyframes.append((pts, pos, False))
+
+    if start is None:
+        return None
+
+    frame_duration = sorted(deltas)[len(deltas) // 2] if deltas else TS_CLOCK // 30
+    end = last + frame_duration
+    return {
+        "start_pts": start,
+        "end_pts": end,
+        "duration": (end - start) / TS_CLOCK,
+        "keyframes": keyframes,
+        "psi": (pat_packet or b"") + (pmt_packet or b"")
+    }
+
+
+def fixup_segment(data, counters, shift):
+    """
+    ajusta um segmento (bytearray) no lugar para continuar o anterior:
+    renumera os continuity counters a partir de `counters` (pid -> último valor)
+    e soma `shift` a todos os PTS, DTS e PCR.
+    """
+    for pos, pid, pusi, afc, payload in _iter_packets(data):
+        if pid == NULL_PID:
+            continue
+
+        # continuity counter só avança em pacotes com payload
+        b3 = data[pos + 3]
+        if pid in counters:
+            cc = (counters[pid] + 1) & 0x0F if afc & 0x01 else counters[pid]
+            data[pos + 3] = (b3 & 0xF0) | cc
+        else:
+            cc = b3 & 0x0F
+        counters[pid] = cc
+
+        if not shift:
+            continue
+
+        # PCR no adaptation field
+        if afc & 0x02 and data[pos + 4] >= 7 and data[pos + 5] & 0x10:
+            _write_pcr_base(data, pos + 6, _read_pcr_base(data, pos + 6) + shift)
+
+        if pusi and afc & 0x01:
+            pts_pos, dts_pos = _pes_timestamp_positions(data, payload, pos + TS_PACKET_SIZE)
+            if pts_pos is not None:
+                _write_timestamp(data, pts_pos, _read_timestamp(data, pts_pos) + shift)
+            if dts_pos is not None:
+                _write_timestamp(data, dts_pos, _read_timestamp(data, dts_pos) + shift)
+
+
+def align_header_counters(header, following):
+    """
+    ajusta no lugar os continuity counters de um header (bytearray com PAT/PMT)
+    para que cada PID termine logo antes do primeiro pacote do mesmo PID em
+    `following`, que é copiado sem alterações depois do header.
+    """
+    positions = {}
+    for pos, pid, _, afc, _ in _iter_packets(header):
+        if afc & 0x01:
+            positions.setdefault(pid, []).append(pos)
+
+    first_counters = {}
+    for pos, pid, _, afc, _ in _iter_packets(following):
+        if pid in positions and pid not in first_counters and afc & 0x01:
+            first_counters[pid] = following[pos + 3] & 0x0F
+            if len(first_counters) == len(positions):
+                break
+
+    for pid, pid_positions in positions.items():
+        if pid not in first_counters:
+            continue
+        cc = first_counters[pid]
+        for pos in reversed(pid_positions):
+            cc = (cc - 1) & 0x0F
+            header[pos + 3] = (header[pos + 3] & 0xF0) | cc
+
+
+def _read_head(source, offset, end, size):
+    """primeiros `size` bytes de um segmento (arquivo ou buffer) a partir de offset"""
+    if end is not None:
+        size = min(size, end - offset)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+    return memoryview(source)[offset:offset + size]
+
+
+def copy_file_into(src_path, out_file, offset=0, end=None):
+    """
+    copia os bytes [offset, end) de um arquivo para out_file sem passar pelo python
+    (copy_file_range entre arquivos, sendfile para pipes), com cópia em blocos como fallback.
+    """
+    out_file.flush()
+    out_fd = out_file.fileno()
+    with open(src_path, "rb") as src:
+        src_fd = src.fileno()
+        size = os.fstat(src_fd).st_size
+        remaining = (size if end is None else min(end, size)) - offset
+
+        for copy in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+            if copy is None:
+                continue
+            start = offset
+            try:
+                while remaining > 0:
+                    if copy is os.sendfile:
+                        copied = os.sendfile(out_fd, src_fd, offset, remaining)
+                    else:
+                        copied = os.copy_file_range(src_fd, out_fd, remaining, offset)
+                    if copied == 0:
+                        break
+                    offset += copied
+                    remaining -= copied
+                return
+            except OSError as e:
+                # só é seguro trocar de método se nada foi copiado ainda
+                if offset != start:
+                    raise
+                logger.debug(f"cópia zero-copy indisponível para {src_path}: {e}")
+
+        src.seek(offset)
+        while remaining > 0:
+            chunk = src.read(min(COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            out_file.write(chunk)
+            remaining -= len(chunk)
+
+
+def write_concatenated(segments, out_file, fix_up=False, header=b""):
+    """
+    escreve os segmentos .ts concatenados em out_file (arquivo ou pipe binário).
+
+    segments é uma lista de (fonte, offset inicial, offset final ou None), onde a
+    fonte é o caminho de um arquivo ou um buffer (bytes/memoryview); header é escrito
+    antes de tudo (ex.: PAT/PMT quando o corte cai em um keyframe sem elas).
+
+    com fix_up=False os bytes são copiados direto do kernel: serve para segmentos
+    gerados pelo mesmo processo FFmpeg, que já têm timestamps e continuity counters
+    contínuos. com fix_up=True (um processo por segmento) cada segmento é lido em
+    memória e tem counters e timestamps ajustados para continuar o anterior.
+    nos dois casos os counters do header continuam nos pacotes que vêm depois dele.
+    """
+    header = bytearray(header)
+
+    if not fix_up:
+        if header:
+            if segments:
+                align_header_counters(header, _read_head(*segments[0], HEADER_SCAN_SIZE))
+            out_file.write(header)
+        for source, offset, end in segments:
+            if isinstance(source, (str, os.PathLike)):
+                copy_file_into(source, out_file, offset, end)
+            else:
+                out_file.write(memoryview(source)[offset:end])
+        out_file.flush()
+        return
+
+    counters = {}
+    if header:
+        # o header inicia a sequência de counters que os segmentos continuam
+        fixup_segment(header, counters, 0)
+        out_file.write(header)
+
+    next_pts = None
+    for source, offset, end in segments:
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                f.seek(offset)
+                data = bytearray(f.read() if end is None else f.read(end - offset))
+        else:
+            data = bytearray(memoryview(source)[offset:end])
+
+        first, last, frame_duration = video_pts_bounds(data)
+        shift = 0
+        if next_pts is not None and first is not None:
+            shift = next_pts - first
+        fixup_segment(data, counters, shift)
+        if last is not None:
+            next_pts = last + shift + frame_duration
+
+        out_file.write(data)
+    out_file.flush()
+
+
+def concat_segments(segments, output_path, fix_up=False, header=b""):
+    """concatena segmentos .ts em um único arquivo .ts, sem subprocessos"""
+    with open(output_path, "wb") as out:
+        write_concatenated(segments, out, fix_up=fix_up, header=header)
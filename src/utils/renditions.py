@@ -0,0 +1,319 @@
+import os
+import sys
+import time
+import shutil
+import threading
+import subprocess
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.mp4_layout import mp4_output_args
+from src.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# renditions geradas depois de salvar um replay, da menor para a maior (a menor
+# fica pronta primeiro, e é a que os celulares no Wi-Fi do local precisam).
+# bitrate em kbit/s; renditions com altura maior ou igual à do original não são geradas
+DEFAULT_RENDITIONS = [
+    {"name": "360p", "height": 360, "bitrate": 600},
+    {"name": "480p", "height": 480, "bitrate": 1000},
+    {"name": "720p", "height": 720, "bitrate": 2500}
+]
+
+# valores de ?rendition= que não são uma rendition
+ORIGINAL_RENDITION = "original"
+AUTO_RENDITION = "auto"
+
+# client hints usados na escolha automática (enviados em Accept-CH)
+RENDITION_CLIENT_HINTS = ("Save-Data", "Downlink", "ECT", "Sec-CH-Viewport-Width", "Viewport-Width")
+
+# banda estimada em Mbit/s de cada ECT (effective connection type)
+ECT_DOWNLINK = {"slow-2g": 0.05, "2g": 0.25, "3g": 0.7, "4g": None}
+
+# fração da banda medida que uma rendition pode ocupar
+DOWNLINK_HEADROOM = 0.7
+
+TRANSCODE_SECONDS = REGISTRY.histogram(
+    "rebote_rendition_transcode_seconds", "tempo para gerar uma rendition de um replay", ["rendition"],
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600))
+
+
+def rendition_filename(filename, name):
+    """nome do arquivo de uma rendition: replay_x.mp4 -> replay_x_480p.mp4"""
+    base = os.path.splitext(filename)[0]
+    return f"{base}_{name}.mp4"
+
+
+def select_rendition(available, requested=None, headers=None, original_bitrate=None, renditions=DEFAULT_RENDITIONS):
+    """
+    escolhe a rendition a enviar. retorna o nome ou None para o arquivo original.
+
+    Args:
+        available: nomes das renditions já geradas para o replay
+        requested: valor de ?rendition= ("original", "auto", um nome ou None)
+        headers: cabeçalhos do request, para a escolha por client hints
+        original_bitrate: bitrate médio do original em kbit/s, se conhecido
+    """
+    ladder = [rendition for rendition in renditions if rendition["name"] in available]
+    if requested == ORIGINAL_RENDITION or not ladder:
+        return None
+
+    if requested and requested != AUTO_RENDITION:
+        # rendition pedida ainda não gerada: a maior disponível que não passe dela
+        target = next((rendition for rendition in renditions if rendition["name"] == requested), None)
+        if target is None:
+            return None
+        fitting = [rendition for rendition in ladder if rendition["height"] <= target["height"]]
+        return fitting[-1]["name"] if fitting else None
+
+    headers = headers or {}
+    if headers.get("Save-Data", "").strip().lower() == "on":
+        return ladder[0]["name"]
+
+    candidates = ladder
+    fits_original = True
+    viewport = _parse_float(headers.get("Sec-CH-Viewport-Width") or headers.get("Viewport-Width"))
+    if viewport is not None:
+        # largura 16:9 da rendition contra o viewport em pixels CSS (até 2x de densidade)
+        candidates = [rendition for rendition in ladder if rendition["height"] * 16 / 9 <= viewport * 2] or ladder[:1]
+        fits_original = len(candidates) == len(ladder)
+
+    downlink = _parse_float(headers.get("Downlink"))
+    if downlink is None:
+        downlink = ECT_DOWNLINK.get(headers.get("ECT", "").strip().lower())
+    if downlink is not None:
+        budget = downlink * 1000 * DOWNLINK_HEADROOM
+        if fits_original and original_bitrate is not None and original_bitrate <= budget:
+            return None
+        candidates = [rendition for rendition in candidates if rendition["bitrate"] <= budget] or candidates[:1]
+    elif fits_original and requested != AUTO_RENDITION:
+        # sem indício de limitação: só troca o original quando pedido com ?rendition=auto
+        return None
+    return candidates[-1]["name"]
+
+
+def _parse_float(value):
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def probe_video_height(path):
+    """altura do vídeo de um arquivo, via ffprobe; None se não for possível ler"""
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe",
+                "-v", "error",
+                "-select_streams", "v:0",
+                "-show_entries", "stream=height",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                path
+            ],
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+        return int(result.stdout.split()[0])
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError):
+        return None
+
+
+def _nice_prefix(niceness):
+    """
+    prefixo que inicia o comando já com prioridade baixa (nice no POSIX). o
+    setpriority depois do Popen só alcança a thread principal no Linux: as
+    threads do x264 criadas antes dele continuariam com a prioridade normal.
+    não usa preexec_fn, que não é seguro com as outras threads da aplicação
+    """
+    if sys.platform == "win32":
+        return []
+    nice = shutil.which("nice")
+    if nice is None:
+        logger.warning("comando nice não encontrado, renditions com prioridade normal")
+        return []
+    return [nice, "-n", str(niceness)]
+
+
+class RenditionTranscoder:
+    """
+    gera em segundo plano versões menores (resolução e bitrate) dos replays salvos.
+
+    os encodes rodam em um pool limitado (`max_workers` FFmpeg ao mesmo
+    tempo, cada um com `threads` threads) e com prioridade baixa (nice no
+    POSIX, BELOW_NORMAL no Windows), para que a captura ao vivo dos buffers
+    circulares sempre tenha CPU. replays além de `max_pending` na fila são
+    ignorados: as renditions são opcionais e o original continua disponível.
+    """
+
+    def __init__(self, directory, renditions=None, max_workers=1, max_pending=32, niceness=19, threads=2,
+                 preset="veryfast", timeout=600, on_complete=None):
+        """
+        Args:
+            directory: diretório dos replays (as renditions ficam ao lado do original)
+            renditions: lista de renditions, da menor para a maior
+            max_workers: encodes executando ao mesmo tempo
+            max_pending: replays aceitos (executando + na fila)
+            niceness: prioridade dos processos FFmpeg no POSIX (0 a 19)
+            threads: threads de cada FFmpeg
+            preset: preset do libx264
+            timeout: tempo máximo em segundos de um encode
+            on_complete: função (id do replay, nome da rendition, arquivo, tamanho) chamada a cada rendition gerada
+        """
+        self.directory = directory
+        self.renditions = renditions or DEFAULT_RENDITIONS
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.niceness = niceness
+        self.threads = threads
+        self.preset = preset
+        self.timeout = timeout
+        self.on_complete = on_complete
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rendition")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._stopping = False
+
+        self._completed = 0
+        self._failed = 0
+        self._dropped = 0
+        self._pending = 0
+
+    def submit(self, replay_id, filename):
+        """enfileira as renditions de um replay. retorna False se a fila estiver cheia ou o pool encerrado"""
+        if self._stopping:
+            return False
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._dropped += 1
+            logger.warning(f"fila de renditions cheia, replay {replay_id} fica só com o original")
+            return False
+        with self._lock:
+            self._pending += 1
+        try:
+            self._executor.submit(self._run, replay_id, filename)
+        except RuntimeError as e:
+            # pool encerrado (aplicação finalizando)
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            logger.error(f"não foi possível enfileirar as renditions do replay {replay_id}: {e}")
+            return False
+        return True
+
+    def _run(self, replay_id, filename):
+        try:
+            source_path = os.path.join(self.directory, filename)
+            source_height = probe_video_height(source_path)
+            for rendition in self.renditions:
+                if self._stopping:
+                    return
+                if source_height is not None and rendition["height"] >= source_height:
+                    continue
+                output_name = rendition_filename(filename, rendition["name"])
+                started = time.perf_counter()
+                if not self.transcode(source_path, os.path.join(self.directory, output_name), rendition):
+                    with self._lock:
+                        self._failed += 1
+                    continue
+                TRANSCODE_SECONDS.observe(time.perf_counter() - started, rendition=rendition["name"])
+                with self._lock:
+                    self._completed += 1
+                logger.info(f"rendition {rendition['name']} do replay {replay_id} gerada")
+                if self.on_complete is not None:
+                    try:
+                        self.on_complete(replay_id, rendition["name"], output_name,
+                                         os.path.getsize(os.path.join(self.directory, output_name)))
+                    except Exception as e:
+                        logger.error(f"erro ao registrar a rendition {output_name}: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+
+    def _ffmpeg_cmd(self, source_path, output_path, rendition):
+        bitrate = rendition["bitrate"]
+        return [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel", "error",
+            "-i", source_path,
+            "-map", "0:v:0",
+            "-map", "0:a?",
+            "-vf", f"scale=-2:{rendition['height']}",
+            "-c:v", "libx264",
+            "-preset", self.preset,
+            "-profile:v", "main",
+            "-pix_fmt", "yuv420p",
+            "-b:v", f"{bitrate}k",
+            "-maxrate", f"{bitrate}k",
+            "-bufsize", f"{bitrate * 2}k",
+            "-threads", str(self.threads),
+            "-c:a", "aac",
+            "-b:a", "96k",
+            *mp4_output_args("faststart"),
+            "-y",
+            output_path
+        ]
+
+    def transcode(self, source_path, output_path, rendition):
+        """gera uma rendition em um arquivo temporário e troca de forma atômica; retorna True se gerou"""
+        tmp_path = f"{output_path}.tmp"
+        creationflags = subprocess.BELOW_NORMAL_PRIORITY_CLASS if sys.platform == "win32" else 0
+        try:
+            process = subprocess.Popen([*_nice_prefix(self.niceness), *self._ffmpeg_cmd(source_path, tmp_path, rendition)],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                       creationflags=creationflags)
+            with self._lock:
+                self._processes.add(process)
+            try:
+                _, stderr = process.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                logger.error(f"encode de {output_path} passou de {self.timeout}s e foi cancelado")
+                return False
+            finally:
+                with self._lock:
+                    self._processes.discard(process)
+
+            if process.returncode != 0:
+                if not self._stopping:
+                    logger.error(f"erro ao gerar {output_path}: {stderr.decode(errors='replace')}")
+                return False
+            os.replace(tmp_path, output_path)
+            return True
+        except OSError as e:
+            logger.error(f"erro ao gerar {output_path}: {e}")
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def shutdown(self, wait=True):
+        """descarta a fila e encerra os encodes em andamento"""
+        self._stopping = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            process.kill()
+        if wait:
+            self._executor.shutdown(wait=True)
+
+    def get_info(self):
+        with self._lock:
+            return {
+                "renditions": [rendition["name"] for rendition in self.renditions],
+                "max_workers": self.max_workers,
+                "pending": self._pending,
+                "completed": self._completed,
+                "failed": self._failed,
+                "dropped": self._dropped
+            }
@@ -0,0 +1,121 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayJobQueue:
+    """
+    fila limitada de jobs de replay executados por um pool de threads.
+
+    o request só enfileira o job e responde na hora; o trabalho pesado
+    (concatenação dos segmentos e atualização do banco) roda no pool.
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, max_finished=256):
+        """
+        Args:
+            max_workers: número de jobs executando ao mesmo tempo
+            max_pending: número máximo de jobs aceitos (executando + na fila)
+            max_finished: quantos jobs finalizados manter em memória para consulta
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="replay-job")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def submit(self, job_id, fn, *args, **kwargs):
+        """
+        enfileira um job. retorna False se a fila estiver cheia.
+
+        fn deve retornar True em caso de sucesso; exceções são tratadas como erro.
+        """
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"fila de replays cheia, job {job_id} recusado")
+            return False
+
+        job = {
+            "status": "processing",
+            "created_at": time.time(),
+            "finished_at": None,
+            "done": threading.Event()
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+
+        try:
+            self._executor.submit(self._run, job_id, job, fn, args, kwargs)
+        except RuntimeError as e:
+            # executor encerrado (aplicação finalizando)
+            logger.error(f"não foi possível enfileirar o job {job_id}: {e}")
+            self._finish(job_id, job, "error")
+            return False
+
+        logger.info(f"job de replay {job_id} enfileirado")
+        return True
+
+    def _run(self, job_id, job, fn, args, kwargs):
+        """executa o job e registra o resultado"""
+        status = "error"
+        try:
+            if fn(*args, **kwargs):
+                status = "saved"
+        except Exception as e:
+            logger.error(f"erro inesperado no job de replay {job_id}: {e}", exc_info=True)
+        finally:
+            self._finish(job_id, job, status)
+
+    def _finish(self, job_id, job, status):
+        """marca o job como finalizado e libera sua vaga na fila"""
+        with self._lock:
+            job["status"] = status
+            job["finished_at"] = time.time()
+            self._prune()
+        job["done"].set()
+        self._slots.release()
+        logger.info(f"job de replay {job_id} finalizado com status '{status}'")
+
+    def _prune(self):
+        """descarta os jobs finalizados mais antigos (chamado com o lock)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get_status(self, job_id):
+        """retorna o status do job ou None se ele não for conhecido por este processo"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job["status"] if job else None
+
+    def wait(self, job_id, timeout):
+        """
+        aguarda o job terminar por até timeout segundos.
+        retorna o status final, o status atual se o tempo esgotar, ou None se o job não for conhecido.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job["done"].wait(timeout)
+        return job["status"]
+
+    def get_info(self):
+        """retorna informações sobre a ocupação da fila"""
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job["finished_at"] is None)
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": active
+        }
+
+    def shutdown(self, wait=True):
+        """encerra o pool, aguardando os jobs em andamento"""
+        self._executor.shutdown(wait=wait)
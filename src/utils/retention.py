@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import threading
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from src.models.user import db
+from src.models.replay import Replay
+from src.utils.renditions import rendition_filename
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionPolicy:
+    """
+    limites de armazenamento dos replays. qualquer limite None fica desativado.
+    replays fixados (pinned) nunca são removidos, mas contam para os limites.
+    """
+
+    def __init__(self, max_bytes=None, max_age_days=None, max_count=None):
+        """
+        Args:
+            max_bytes: espaço máximo ocupado pelos replays
+            max_age_days: idade máxima de um replay em dias
+            max_count: número máximo de replays
+        """
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.max_count = max_count
+
+    def to_dict(self):
+        return {
+            "max_bytes": self.max_bytes,
+            "max_age_days": self.max_age_days,
+            "max_count": self.max_count
+        }
+
+
+class RetentionEngine:
+    """
+    aplica a política de retenção em segundo plano: remove os replays mais
+    antigos (arquivo e registro no banco) em lotes até que todos os limites
+    sejam respeitados. roda a cada `interval` segundos ou quando acordada
+    com wake() (ex.: depois de salvar um replay).
+    """
+
+    # status de replays que podem ser removidos (nunca um que ainda está sendo salvo)
+    EVICTABLE_STATUSES = ("saved", "error")
+
+    def __init__(self, policy, replays_dir, storage_accounting, db_writer, interval=300, batch_size=50,
+                 event_callback=None, stale_processing_after=None):
+        """
+        Args:
+            policy: RetentionPolicy
+            replays_dir: diretório dos arquivos de replay
+            storage_accounting: StorageAccounting com o uso atual do diretório
+            db_writer: WriteBehindQueue que grava a remoção dos registros
+            interval: intervalo em segundos entre as verificações
+            batch_size: replays removidos por transação
+            event_callback: função (evento, dados) chamada para cada replay removido
+            stale_processing_after: segundos depois dos quais um replay em 'processing'
+                é de um job perdido e também pode ser removido (None: nunca)
+        """
+        self.policy = policy
+        self.replays_dir = replays_dir
+        self.storage_accounting = storage_accounting
+        self.db_writer = db_writer
+        self.interval = interval
+        self.batch_size = batch_size
+        self.event_callback = event_callback
+        self.stale_processing_after = stale_processing_after
+
+        self._app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+
+        self._last_run = None
+        self._evicted = {"max_age": 0, "max_count": 0, "max_bytes": 0}
+        self._evicted_bytes = 0
+        self._recent = deque(maxlen=50)  # últimas decisões, para o status
+
+    def start(self, app):
+        """inicia a thread de retenção (precisa da aplicação para acessar o banco)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._app = app
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="replay-retention", daemon=True)
+        self._thread.start()
+        # primeira verificação logo ao iniciar
+        self.wake()
+
+    def wake(self):
+        """pede uma verificação imediata"""
+        self._wake_event.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def _run_loop(self):
+        while True:
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+            try:
+                with self._app.app_context():
+                    self.run_once()
+            except Exception as e:
+                logger.error(f"erro ao aplicar a política de retenção: {e}", exc_info=True)
+
+    def run_once(self):
+        """
+        aplica todos os limites uma vez. deve rodar dentro do contexto da aplicação.
+        retorna o número de replays removidos.
+        """
+        evicted = 0
+        policy = self.policy
+
+        if policy.max_age_days is not None:
+            cutoff = datetime.utcnow() - timedelta(days=policy.max_age_days)
+            while not self._stop_event.is_set():
+                batch = self._oldest_evictable(self.batch_size, older_than=cutoff)
+                if not batch:
+                    break
+                removed = len(self._evict(batch, "max_age"))
+                evicted += removed
+                # lote incompleto: acabaram os antigos (ou nada pôde ser removido)
+                if removed < self.batch_size:
+                    break
+
+        if policy.max_count is not None:
+            excess = Replay.query.count() - policy.max_count
+            while excess > 0 and not self._stop_event.is_set():
+                batch = self._oldest_evictable(min(excess, self.batch_size))
+                if not batch:
+                    break
+                removed = len(self._evict(batch, "max_count"))
+                if not removed:
+                    break
+                evicted += removed
+                excess -= removed
+
+        if policy.max_bytes is not None and self.storage_accounting.get_usage() > policy.max_bytes:
+            # o uso do diretório inclui arquivos sem registro (órfãos, .tmp) que a
+            # retenção não remove: o limite vale para os bytes dos replays no banco
+            replay_bytes = self._replay_bytes()
+            untracked = self.storage_accounting.get_usage() - replay_bytes
+            if untracked > 0 and replay_bytes <= policy.max_bytes:
+                logger.warning(f"limite de armazenamento excedido por {untracked} bytes em arquivos "
+                               f"sem replay no banco, que a retenção não remove")
+            excess_bytes = replay_bytes - policy.max_bytes
+            while excess_bytes > 0 and not self._stop_event.is_set():
+                # só o necessário para voltar ao limite, em lotes de até batch_size
+                batch = []
+                batch_bytes = excess_bytes
+                for replay in self._oldest_evictable(self.batch_size):
+                    batch.append(replay)
+                    batch_bytes -= replay.stored_bytes()
+                    if batch_bytes <= 0:
+                        break
+                if not batch:
+                    logger.warning("limite de armazenamento excedido, mas só restam replays fixados")
+                    break
+                stored = {replay.id: replay.stored_bytes() for replay in batch}
+                removed = self._evict(batch, "max_bytes")
+                if not removed:
+                    break
+                evicted += len(removed)
+                # desconta o que saiu de fato (um replay fixado nesse meio tempo fica)
+                excess_bytes -= sum(stored[replay_id] for replay_id in removed)
+
+        with self._lock:
+            self._last_run = time.time()
+        if evicted:
+            logger.info(f"retenção: {evicted} replays removidos")
+        return evicted
+
+    def _replay_bytes(self):
+        """bytes dos replays registrados no banco (originais e renditions)"""
+        used_bytes = db.session.query(db.func.coalesce(db.func.sum(Replay.file_size), 0)).scalar()
+        for (renditions,) in db.session.query(Replay.renditions).filter(Replay.renditions.isnot(None)):
+            used_bytes += sum(json.loads(renditions).values())
+        return used_bytes
+
+    def _oldest_evictable(self, limit, older_than=None):
+        evictable = Replay.status.in_(self.EVICTABLE_STATUSES)
+        if self.stale_processing_after is not None:
+            stale_cutoff = datetime.utcnow() - timedelta(seconds=self.stale_processing_after)
+            evictable = db.or_(evictable, db.and_(Replay.status == "processing", Replay.timestamp < stale_cutoff))
+        query = Replay.query.filter(
+            evictable,
+            # registros antigos têm pinned NULL
+            db.or_(Replay.pinned.is_(None), Replay.pinned.is_(False))
+        )
+        if older_than is not None:
+            query = query.filter(Replay.timestamp < older_than)
+        return query.order_by(Replay.timestamp.asc(), Replay.id.asc()).limit(limit).all()
+
+    def _evict(self, replays, reason):
+        """
+        remove os registros de um lote pela fila de escrita e, depois do
+        commit, os arquivos. retorna os ids removidos.
+        """
+        candidates = {
+            replay.id: [replay.filename, *(rendition_filename(replay.filename, name) for name in replay.get_renditions())]
+            for replay in replays
+        }
+        # encerra a leitura: com WAL ela continuaria vendo os registros removidos pela fila
+        db.session.rollback()
+
+        def delete_replays(session):
+            # um replay fixado depois da consulta fica
+            ids = [replay_id for (replay_id,) in session.query(Replay.id).filter(
+                Replay.id.in_(candidates),
+                db.or_(Replay.pinned.is_(None), Replay.pinned.is_(False))
+            )]
+            session.query(Replay).filter(Replay.id.in_(ids)).delete(synchronize_session=False)
+            return ids
+
+        try:
+            deleted_ids = self.db_writer.write(delete_replays)
+        except Exception as e:
+            # nada foi removido: tenta de novo na próxima verificação
+            logger.error(f"retenção: erro ao remover registros: {e}")
+            return []
+
+        removed = []
+        freed_bytes = 0
+        for replay_id in deleted_ids:
+            file_size = 0
+            # renditions vão junto com o original
+            for filename in candidates[replay_id]:
+                file_path = os.path.join(self.replays_dir, filename)
+                try:
+                    size = os.path.getsize(file_path)
+                    os.remove(file_path)
+                    file_size += size
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # o registro já saiu: o arquivo entra na próxima reconciliação do uso de disco
+                    logger.error(f"retenção: não foi possível remover {file_path}: {e}")
+            freed_bytes += file_size
+            removed.append((replay_id, candidates[replay_id][0], file_size))
+
+        self.storage_accounting.remove(freed_bytes)
+
+        now = time.time()
+        with self._lock:
+            self._evicted[reason] += len(removed)
+            self._evicted_bytes += freed_bytes
+            for replay_id, filename, file_size in removed:
+                self._recent.append({
+                    "id": replay_id,
+                    "filename": filename,
+                    "reason": reason,
+                    "bytes": file_size,
+                    "at": now
+                })
+        if self.event_callback is not None:
+            for replay_id, _, _ in removed:
+                self.event_callback("replay.deleted", {"id": replay_id, "reason": reason})
+        logger.info(f"retenção ({reason}): {len(removed)} replays removidos, {freed_bytes} bytes liberados")
+        return deleted_ids
+
+    def get_info(self):
+        with self._lock:
+            return {
+                "policy": self.policy.to_dict(),
+                "interval": self.interval,
+                "last_run": self._last_run,
+                "evicted": dict(self._evicted),
+                "evicted_bytes": self._evicted_bytes,
+                "recent": list(self._recent)
+            }
+
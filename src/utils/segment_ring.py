@@ -0,0 +1,160 @@
+import threading
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentLease:
+    """
+    snapshot imutável de segmentos do anel. enquanto o lease estiver aberto os
+    segmentos não são descartados, mesmo que já tenham saído do anel.
+    """
+
+    def __init__(self, ring, entries):
+        self._ring = ring
+        # tupla de (id do segmento, índice), do mais antigo ao mais novo
+        self.entries = entries
+        self._released = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def release(self):
+        """devolve os segmentos ao anel; pode ser chamado mais de uma vez"""
+        if self._released:
+            return
+        self._released = True
+        self._ring._release(segment_id for segment_id, _ in self.entries)
+
+
+class SegmentRing:
+    """
+    anel de segmentos compartilhado entre a thread de captura e as de salvamento.
+
+    push() e lease() só seguram o lock para copiar referências, nunca durante
+    E/S, então a captura não espera um salvamento. cada segmento tem um contador
+    de leases: um segmento que sai do anel enquanto está em uso por um
+    salvamento (ou por uma prévia HLS) só é descartado quando o último lease é
+    devolvido.
+
+    o anel também numera as descontinuidades (troca de geração, ou seja, de
+    processo FFmpeg, entre um segmento e o seguinte) com um contador que só
+    cresce, usado no EXT-X-DISCONTINUITY-SEQUENCE da prévia HLS.
+    """
+
+    def __init__(self, capacity, on_evict):
+        """
+        Args:
+            capacity: número máximo de segmentos no anel
+            on_evict: função (id do segmento) que libera o arquivo ou slot do segmento
+        """
+        self.capacity = capacity
+        self._on_evict = on_evict
+        self._lock = threading.Lock()
+        self._entries = deque()  # (id do segmento, índice)
+        self._index = {}  # id do segmento -> índice
+        self._leases = {}  # id do segmento -> leases abertos
+        self._retired = set()  # fora do anel, aguardando o último lease
+        self._discontinuities = 0  # trocas de geração desde o primeiro segmento
+        self._sequence = {}  # id do segmento -> descontinuidades antes dele
+
+    def push(self, segment_id, index):
+        """adiciona um segmento finalizado, descartando os mais antigos além da capacidade"""
+        evicted = []
+        generation = index["generation"] if index else None
+        with self._lock:
+            if self._entries:
+                previous = self._entries[-1][1]
+                if generation != (previous["generation"] if previous else None):
+                    self._discontinuities += 1
+            self._entries.append((segment_id, index))
+            self._index[segment_id] = index
+            self._sequence[segment_id] = self._discontinuities
+            while len(self._entries) > self.capacity:
+                old_id, _ = self._entries.popleft()
+                self._index.pop(old_id, None)
+                self._sequence.pop(old_id, None)
+                if self._leases.get(old_id):
+                    self._retired.add(old_id)
+                else:
+                    evicted.append(old_id)
+        self._evict(evicted)
+
+    def lease(self, segment_ids=None):
+        """
+        retorna um SegmentLease com todos os segmentos atuais (ou só os de
+        segment_ids que ainda estiverem no anel)
+        """
+        with self._lock:
+            if segment_ids is None:
+                entries = tuple(self._entries)
+            else:
+                wanted = set(segment_ids)
+                entries = tuple(entry for entry in self._entries if entry[0] in wanted)
+            for segment_id, _ in entries:
+                self._leases[segment_id] = self._leases.get(segment_id, 0) + 1
+        return SegmentLease(self, entries)
+
+    def _release(self, segment_ids):
+        evicted = []
+        with self._lock:
+            for segment_id in segment_ids:
+                count = self._leases.get(segment_id, 0) - 1
+                if count > 0:
+                    self._leases[segment_id] = count
+                    continue
+                self._leases.pop(segment_id, None)
+                if segment_id in self._retired:
+                    self._retired.discard(segment_id)
+                    evicted.append(segment_id)
+        self._evict(evicted)
+
+    def _evict(self, segment_ids):
+        for segment_id in segment_ids:
+            try:
+                self._on_evict(segment_id)
+            except Exception as e:
+                logger.error(f"erro ao descartar o segmento {segment_id}: {e}")
+
+    def snapshot(self):
+        """cópia dos (id, índice) atuais sem lease, para leitura de metadados"""
+        with self._lock:
+            return tuple(self._entries)
+
+    def timeline(self):
+        """
+        cópia dos (id, índice, sequência de descontinuidade) atuais sem lease. a
+        sequência muda exatamente onde a geração muda e nunca diminui, mesmo com
+        segmentos sem índice ou depois de um reinício da captura
+        """
+        with self._lock:
+            return tuple((segment_id, index, self._sequence[segment_id]) for segment_id, index in self._entries)
+
+    def get(self, segment_id):
+        """índice de um segmento que está no anel (ou None)"""
+        with self._lock:
+            return self._index.get(segment_id)
+
+    def __contains__(self, segment_id):
+        with self._lock:
+            return segment_id in self._index
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get_info(self):
+        with self._lock:
+            return {
+                "segments": len(self._entries),
+                "leased": len(self._leases),
+                "retired": len(self._retired)
+            }
@@ -0,0 +1,155 @@
+import os
+import threading
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# diretório em RAM (tmpfs) usado para os arquivos temporários do FFmpeg
+SHM_DIR = "/dev/shm"
+
+
+class DiskSegmentStorage:
+    """
+    armazenamento padrão: os segmentos ficam no disco, no diretório onde o FFmpeg grava.
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory: diretório dos segmentos
+        """
+        self.capture_dir = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def commit(self, segment_id, path):
+        """registra um segmento finalizado; no disco não há nada a fazer"""
+        return os.path.exists(path)
+
+    def evict(self, segment_id, path):
+        """descarta um segmento que saiu do buffer"""
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+                logger.debug(f"removido segmento antigo: {path}")
+        except OSError as e:
+            logger.warning(f"não foi possível remover o segmento antigo {path}: {e}")
+
+    def exists(self, segment_id, path):
+        return os.path.exists(path)
+
+    def read(self, segment_id, path):
+        """retorna o conteúdo do segmento (ou None se não existir)"""
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def source(self, segment_id, path):
+        """fonte para concatenação: o caminho, para cópia zero-copy pelo kernel"""
+        return path
+
+    def get_info(self):
+        return {
+            "backend": "disk",
+            "directory": self.capture_dir
+        }
+
+
+class MemorySegmentStorage:
+    """
+    armazenamento em RAM: um número fixo de slots pré-alocados que são
+    sobrescritos no lugar. o FFmpeg grava o segmento em andamento em um
+    diretório tmpfs (/dev/shm); ao finalizar, o segmento é copiado para um
+    slot livre e o arquivo temporário é removido. leituras devolvem
+    memoryviews dos slots, sem cópia, e nada vai para o disco até um replay
+    ser salvo.
+    """
+
+    def __init__(self, slots, name="buffer", slot_size=4 * 1024 * 1024):
+        """
+        Args:
+            slots: número de slots (segmentos no buffer + folga)
+            name: nome do diretório temporário do FFmpeg dentro de /dev/shm
+            slot_size: tamanho inicial de cada slot em bytes; cresce se um segmento não couber
+        """
+        base = SHM_DIR if os.path.isdir(SHM_DIR) else tempfile.gettempdir()
+        if base != SHM_DIR:
+            logger.warning(f"{SHM_DIR} indisponível, segmentos em andamento ficarão em {base}")
+        staging_dir = os.path.join(base, f"rebote-{name}")
+
+        self.capture_dir = staging_dir
+        os.makedirs(staging_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._slots = [bytearray(slot_size) for _ in range(slots)]
+        self._free_slots = list(range(slots))
+        self._segments = {}  # segment_id -> (slot, tamanho)
+
+    def commit(self, segment_id, path):
+        """copia o segmento finalizado para um slot livre e remove o arquivo temporário"""
+        with self._lock:
+            if self._free_slots:
+                # o slot liberado há mais tempo é o reutilizado primeiro
+                slot = self._free_slots.pop(0)
+            else:
+                # todos os slots ocupados por segmentos ainda em uso por salvamentos
+                logger.warning(f"nenhum slot livre para o segmento {segment_id}, alocando mais um")
+                self._slots.append(bytearray(len(self._slots[0])))
+                slot = len(self._slots) - 1
+
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size > len(self._slots[slot]):
+                    logger.warning(f"segmento {segment_id} ({size} bytes) maior que o slot, realocando")
+                    self._slots[slot] = bytearray(size + size // 4)
+                read = f.readinto(memoryview(self._slots[slot])[:size])
+            os.remove(path)
+        except OSError as e:
+            logger.error(f"erro ao carregar o segmento {segment_id} na memória: {e}")
+            with self._lock:
+                self._free_slots.append(slot)
+            return False
+
+        with self._lock:
+            self._segments[segment_id] = (slot, read)
+        return True
+
+    def evict(self, segment_id, path):
+        """libera o slot do segmento que saiu do buffer"""
+        with self._lock:
+            entry = self._segments.pop(segment_id, None)
+            if entry:
+                self._free_slots.append(entry[0])
+
+    def exists(self, segment_id, path):
+        with self._lock:
+            return segment_id in self._segments
+
+    def read(self, segment_id, path):
+        """retorna um memoryview do slot do segmento (ou None)"""
+        with self._lock:
+            entry = self._segments.get(segment_id)
+        if entry is None:
+            return None
+        slot, size = entry
+        return memoryview(self._slots[slot])[:size]
+
+    def source(self, segment_id, path):
+        """fonte para concatenação: o memoryview do slot"""
+        return self.read(segment_id, path)
+
+    def get_info(self):
+        with self._lock:
+            used = sum(size for _, size in self._segments.values())
+            free = len(self._free_slots)
+        return {
+            "backend": "memory",
+            "staging_dir": self.capture_dir,
+            "slots": len(self._slots),
+            "free_slots": free,
+            "allocated_bytes": sum(len(slot) for slot in self._slots),
+            "used_bytes": used
+        }
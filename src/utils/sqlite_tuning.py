@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import logging
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# tempo que uma conexão espera por um lock de escrita de outro processo
+BUSY_TIMEOUT_SECONDS = 5.0
+
+# aplicados em cada conexão nova do pool
+SQLITE_PRAGMAS = (
+    # WAL: leitores não esperam escritores e vice-versa
+    ("journal_mode", "WAL"),
+    # com WAL, NORMAL só sincroniza no checkpoint e continua seguro contra corrupção
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", int(BUSY_TIMEOUT_SECONDS * 1000)),
+    ("temp_store", "MEMORY"),
+    # cache de páginas de ~16MB por conexão (valor negativo é em KiB)
+    ("cache_size", -16000),
+)
+
+
+@event.listens_for(Engine, "connect")
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def configure_sqlite(app, db_path, pool_size=10, max_overflow=20):
+    """
+    aponta a aplicação para o banco SQLite em db_path (criando o diretório) e
+    configura o pool de conexões. cada request e cada thread de job pega uma
+    conexão do pool em vez de abrir o arquivo de novo.
+    """
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': QueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_pre_ping': True,
+        'connect_args': {
+            # conexões do pool são usadas por threads diferentes (requests, jobs, retenção)
+            'check_same_thread': False,
+            'timeout': BUSY_TIMEOUT_SECONDS
+        }
+    }
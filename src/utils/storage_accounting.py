@@ -0,0 +1,98 @@
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StorageAccounting:
+    """
+    contabiliza o espaço ocupado pelos replays sem varrer o diretório a cada consulta.
+    o total é atualizado quando um replay é salvo ou removido, e um reconciliador
+    em segundo plano confere o diretório de tempos em tempos para corrigir
+    diferenças (arquivos apagados à mão, falhas no meio de uma gravação etc.).
+    """
+
+    def __init__(self, directory, reconcile_interval=600):
+        """
+        Args:
+            directory: diretório dos replays
+            reconcile_interval: intervalo em segundos entre as conferências do diretório
+        """
+        self.directory = directory
+        self.reconcile_interval = reconcile_interval
+
+        self._lock = threading.Lock()
+        self._used_bytes = 0
+        self._reconciled_at = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def set_usage(self, used_bytes):
+        """define o total (ex.: a soma de Replay.file_size ao iniciar)"""
+        with self._lock:
+            self._used_bytes = used_bytes
+
+    def add(self, nbytes):
+        """registra um arquivo novo de nbytes"""
+        with self._lock:
+            self._used_bytes += nbytes or 0
+
+    def remove(self, nbytes):
+        """registra a remoção de um arquivo de nbytes"""
+        with self._lock:
+            self._used_bytes = max(self._used_bytes - (nbytes or 0), 0)
+
+    def get_usage(self):
+        """bytes ocupados pelos replays"""
+        with self._lock:
+            return self._used_bytes
+
+    def reconcile(self):
+        """soma o tamanho real dos arquivos do diretório e corrige o total"""
+        used_bytes = 0
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        used_bytes += entry.stat().st_size
+        except OSError as e:
+            logger.error(f"erro ao conferir o diretório de replays: {e}")
+            return self.get_usage()
+
+        with self._lock:
+            drift = used_bytes - self._used_bytes
+            self._used_bytes = used_bytes
+            self._reconciled_at = time.time()
+
+        if drift:
+            logger.warning(f"uso de armazenamento corrigido em {drift:+d} bytes ({used_bytes} bytes em uso)")
+        return used_bytes
+
+    def start(self):
+        """inicia o reconciliador em segundo plano"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._reconcile_loop, name="storage-reconciler", daemon=True)
+        self._thread.start()
+
+    def _reconcile_loop(self):
+        while not self._stop_event.wait(self.reconcile_interval):
+            self.reconcile()
+
+    def stop(self):
+        """para o reconciliador"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def get_info(self):
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "used_bytes": self._used_bytes,
+                "reconciled_at": self._reconciled_at,
+                "reconcile_interval": self.reconcile_interval
+            }
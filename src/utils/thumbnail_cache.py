@@ -0,0 +1,161 @@
+import os
+import hashlib
+import subprocess
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# tamanhos dos posters: nome -> largura em pixels (altura proporcional)
+POSTER_SIZES = {
+    "small": 320,
+    "medium": 640,
+    "large": 1280
+}
+
+
+class ThumbnailCache:
+    """
+    cache de imagens endereçado pelo conteúdo: cada imagem é salva com o
+    sha256 dos seus bytes como nome, então imagens iguais não se repetem e
+    uma URL com a chave nunca muda de conteúdo. quando o tamanho total passa
+    de max_bytes, as imagens acessadas há mais tempo são removidas.
+    """
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._total_bytes = sum(os.path.getsize(path) for path in self._iter_files())
+
+    def _iter_files(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".jpg"):
+                    yield os.path.join(root, name)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.jpg")
+
+    def put(self, data):
+        """armazena a imagem e retorna sua chave (sha256)"""
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        if os.path.exists(path):
+            os.utime(path)
+            return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += len(data)
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+        return key
+
+    def get_path(self, key):
+        """retorna o caminho da imagem (ou None se não estiver no cache)"""
+        if not key or not all(c in "0123456789abcdef" for c in key):
+            return None
+        path = self._path(key)
+        try:
+            # o mtime marca o último acesso para a ordem de remoção
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def evict(self):
+        """remove as imagens acessadas há mais tempo até ficar em 90% do limite"""
+        with self._lock:
+            files = []
+            for path in self._iter_files():
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in files)
+            target = self.max_bytes * 0.9
+            removed = 0
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except OSError as e:
+                    logger.warning(f"não foi possível remover thumbnail {path}: {e}")
+
+            self._total_bytes = total
+        if removed:
+            logger.info(f"{removed} thumbnails removidos do cache ({total} bytes em uso)")
+
+    def generate(self, video_path, position=0.5, duration=None, sizes=POSTER_SIZES):
+        """
+        extrai um keyframe do vídeo em todos os tamanhos com um único FFmpeg
+        e guarda as imagens no cache.
+
+        Args:
+            video_path: vídeo de origem
+            position: posição relativa (0 a 1) do frame dentro do vídeo
+            duration: duração do vídeo em segundos, para calcular a posição
+
+        retorna um dicionário nome do tamanho -> chave (vazio em caso de erro)
+        """
+        names = list(sizes)
+        # sem accurate seek o FFmpeg usa o keyframe anterior à posição, em vez de
+        # descartar tudo até ela (com -skip_frame nokey poderia não sobrar nenhum frame);
+        # o -vsync 0 na saída evita que esse frame, anterior ao -ss, seja descartado
+        seek = ["-ss", f"{duration * position:.3f}", "-noaccurate_seek"] if duration else []
+        split = f"[0:v]split={len(names)}" + "".join(f"[s{i}]" for i in range(len(names)))
+        scales = ";".join(f"[s{i}]scale={sizes[name]}:-2[o{i}]" for i, name in enumerate(names))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ffmpeg_cmd = [
+                "ffmpeg",
+                "-hide_banner",
+                "-loglevel", "error",
+                *seek,
+                "-skip_frame", "nokey",  # decodifica só keyframes
+                "-i", video_path,
+                "-filter_complex", f"{split};{scales}"
+            ]
+            for i, name in enumerate(names):
+                ffmpeg_cmd += ["-map", f"[o{i}]", "-vsync", "0", "-frames:v", "1", "-q:v", "3", "-y", os.path.join(tmp_dir, f"{name}.jpg")]
+
+            try:
+                result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True, timeout=30)
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.error(f"erro ao gerar posters de {video_path}: {e}")
+                return {}
+
+            if result.returncode != 0:
+                logger.error(f"erro ao gerar posters de {video_path}: {result.stderr}")
+                return {}
+
+            keys = {}
+            for name in names:
+                image_path = os.path.join(tmp_dir, f"{name}.jpg")
+                if os.path.exists(image_path):
+                    with open(image_path, "rb") as f:
+                        keys[name] = self.put(f.read())
+            return keys
+
+    def get_info(self):
+        with self._lock:
+            return {
+                "cache_dir": self.cache_dir,
+                "used_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
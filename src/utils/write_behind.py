@@ -0,0 +1,165 @@
+import os
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+from src.models.user import db
+from src.utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = REGISTRY.histogram(
+    "rebote_db_write_batch_size", "operações gravadas por commit da fila de escrita",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+
+
+class WriteBehindQueue:
+    """
+    fila de escrita no banco com uma única thread escritora.
+
+    cada operação é uma função (session) -> resultado. a thread junta as
+    operações que chegam em até `max_delay` segundos (até `max_batch`) e
+    grava todas em um único commit, então vários triggers e atualizações de
+    status simultâneos disputam o lock de escrita do SQLite uma vez só, e os
+    leitores (WAL) nunca esperam um salvamento de replay.
+
+    submit() retorna um Future com o resultado da operação depois do commit;
+    quem precisa do resultado (ex.: ids gerados) espera por ele, quem não
+    precisa segue em frente.
+    """
+
+    _STOP = object()
+
+    def __init__(self, max_batch=100, max_delay=0.02):
+        """
+        Args:
+            max_batch: operações por commit
+            max_delay: tempo máximo em segundos esperando mais operações para o lote
+        """
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self._app = None
+        self._thread = None
+        self._pid = os.getpid()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+        self._batches = 0
+        self._operations = 0
+        self._errors = 0
+        self._last_batch = 0
+
+    def start(self, app):
+        """
+        inicia a thread escritora (precisa da aplicação para acessar o banco).
+        depois de um fork a fila e o lock herdados são descartados, junto com
+        operações do processo pai que nunca seriam gravadas aqui.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            self._lock = threading.Lock()
+            self._thread = None
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run_loop, name="db-write-behind", daemon=True)
+            self._thread.start()
+
+    def submit(self, operation):
+        """enfileira uma operação (session) -> resultado; retorna um Future"""
+        future = Future()
+        if self._thread is None or not self._thread.is_alive():
+            future.set_exception(RuntimeError("fila de escrita no banco não está ativa"))
+            return future
+        self._queue.put((operation, future))
+        return future
+
+    def write(self, operation, timeout=30):
+        """enfileira uma operação e espera o commit; retorna o resultado"""
+        return self.submit(operation).result(timeout)
+
+    def stop(self, timeout=10):
+        """grava o que estiver na fila e encerra a thread"""
+        if self._thread is None:
+            return
+        self._queue.put((self._STOP, None))
+        self._thread.join(timeout=timeout)
+
+    def _run_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # junta o que chegar logo em seguida no mesmo commit
+            while len(batch) < self.max_batch and batch[-1][0] is not self._STOP:
+                try:
+                    batch.append(self._queue.get(timeout=self.max_delay))
+                except queue.Empty:
+                    break
+
+            stop = batch[-1][0] is self._STOP
+            if stop:
+                batch.pop()
+            if batch:
+                try:
+                    with self._app.app_context():
+                        self._write_batch(batch)
+                except Exception as e:
+                    logger.error(f"erro na fila de escrita no banco: {e}", exc_info=True)
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+            if stop:
+                break
+
+    def _write_batch(self, batch):
+        """
+        executa as operações e faz um único commit. se uma operação falhar, o
+        lote é desfeito e refeito sem ela, para que um erro não descarte as outras.
+        """
+        pending = list(batch)
+        while pending:
+            results = []
+            current = None
+            try:
+                for current in pending:
+                    results.append(current[0](db.session))
+                current = None
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self._errors += 1
+                if current is None:
+                    # falha no commit: nenhuma operação foi gravada
+                    logger.error(f"erro ao gravar lote de {len(pending)} operações: {e}")
+                    for _, future in pending:
+                        future.set_exception(e)
+                    return
+                logger.error(f"operação descartada do lote de escrita: {e}")
+                current[1].set_exception(e)
+                pending.remove(current)
+                continue
+            finally:
+                # objetos do lote não devem vazar para o próximo
+                db.session.remove()
+
+            for (_, future), result in zip(pending, results):
+                future.set_result(result)
+            WRITE_BATCH_SIZE.observe(len(pending))
+            with self._lock:
+                self._batches += 1
+                self._operations += len(pending)
+                self._last_batch = len(pending)
+            return
+
+    def get_info(self):
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "batches": self._batches,
+                "operations": self._operations,
+                "errors": self._errors,
+                "last_batch_size": self._last_batch
+            }